@@ -19,6 +19,7 @@ sys.path.append(ROOT_PATH)
 
 from link_dealer.db import engine
 from link_dealer.models import Base
+from link_dealer.partitions import PARTITION_NAME
 
 # add your model's MetaData object here
 # for 'autogenerate' support
@@ -32,6 +33,11 @@ target_metadata = Base.metadata
 # ... etc.
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    # Partitions of link are managed by link_dealer.partitions.
+    return not (type_ == 'table' and reflected and PARTITION_NAME.match(name))
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -48,6 +54,7 @@ def run_migrations_offline():
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -67,7 +74,7 @@ def run_migrations_online():
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_object=include_object
         )
 
         with context.begin_transaction():
@@ -0,0 +1,28 @@
+"""link campaign date index
+
+Revision ID: 2b7d9e4c5a10
+Revises: 8c4e6a1f0d23
+Create Date: 2026-10-18 11:48:05.112874
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b7d9e4c5a10'
+down_revision: Union[str, None] = '8c4e6a1f0d23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_link_campaign_date_id', 'link', [sa.text('campaign_date DESC'), sa.text('id DESC')], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_link_campaign_date_id', table_name='link')
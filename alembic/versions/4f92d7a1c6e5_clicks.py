@@ -0,0 +1,44 @@
+"""clicks
+
+Revision ID: 4f92d7a1c6e5
+Revises: e71c5b93f4a8
+Create Date: 2026-10-18 14:05:33.208417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f92d7a1c6e5'
+down_revision: Union[str, None] = 'e71c5b93f4a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('click',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('link_id', sa.Integer(), nullable=False),
+    sa.Column('clicked_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['link_id'], ['link.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_click_link_id'), 'click', ['link_id'], unique=False)
+    op.create_table('click_daily',
+    sa.Column('link_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('clicks', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['link_id'], ['link.id'], ),
+    sa.PrimaryKeyConstraint('link_id', 'day')
+    )
+    op.create_index('ix_link_full_url', 'link', ['full_url'], unique=False, postgresql_using='hash')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_link_full_url', table_name='link', postgresql_using='hash')
+    op.drop_table('click_daily')
+    op.drop_index(op.f('ix_click_link_id'), table_name='click')
+    op.drop_table('click')
@@ -0,0 +1,31 @@
+"""taxonomy version
+
+Revision ID: 5d1f3c2a9b7e
+Revises: 0bb2a8aece9f
+Create Date: 2026-10-18 10:12:41.315022
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1f3c2a9b7e'
+down_revision: Union[str, None] = '0bb2a8aece9f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    taxonomy_version = op.create_table('taxonomy_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(taxonomy_version, [{'id': 1, 'version': 0}])
+
+
+def downgrade() -> None:
+    op.drop_table('taxonomy_version')
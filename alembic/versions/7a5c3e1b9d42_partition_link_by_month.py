@@ -0,0 +1,113 @@
+"""partition link by month
+
+Revision ID: 7a5c3e1b9d42
+Revises: c9d2e8f4a716
+Create Date: 2026-10-18 16:42:08.117650
+
+"""
+from datetime import date, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a5c3e1b9d42'
+down_revision: Union[str, None] = 'c9d2e8f4a716'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+DIMENSIONS = ['term_material', 'term_page', 'medium', 'source', 'campaign_project', 'content', 'user']
+FILTER_DIMENSIONS = ['term_material', 'term_page', 'medium', 'source', 'campaign_project', 'user']
+COLUMNS = ', '.join([
+    'id', 'target_url', 'campaign_date', 'campaign_dop', 'full_url', 'short_code',
+    *[f'{dimension}_id' for dimension in DIMENSIONS],
+])
+
+
+def _add_months(month: date, months: int) -> date:
+    year, month_index = divmod(month.year * 12 + month.month - 1 + months, 12)
+    return date(year, month_index + 1, 1)
+
+
+def _create_link_table(name: str, partitioned: bool) -> None:
+    op.create_table(name,
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('link_id_seq')"), nullable=False),
+    sa.Column('target_url', sa.String(), nullable=False),
+    sa.Column('campaign_date', sa.DateTime(), nullable=False),
+    sa.Column('campaign_dop', sa.String(), nullable=False),
+    sa.Column('full_url', sa.String(), nullable=False),
+    sa.Column('short_code', sa.String(), nullable=False),
+    *[sa.Column(f'{dimension}_id', sa.Integer(), nullable=False) for dimension in DIMENSIONS],
+    *[sa.ForeignKeyConstraint([f'{dimension}_id'], [f'{dimension}.id'], ) for dimension in DIMENSIONS],
+    sa.PrimaryKeyConstraint('id', 'campaign_date') if partitioned else sa.PrimaryKeyConstraint('id'),
+    **({'postgresql_partition_by': 'RANGE (campaign_date)'} if partitioned else {})
+    )
+
+
+def _create_link_indexes() -> None:
+    op.create_index(
+        'ix_link_campaign_date_id', 'link', [sa.text('campaign_date DESC'), sa.text('id DESC')], unique=False
+    )
+    op.create_index('ix_link_full_url', 'link', ['full_url'], unique=False, postgresql_using='hash')
+    for dimension in FILTER_DIMENSIONS:
+        op.create_index(
+            f'ix_link_{dimension}_id_campaign_date_id', 'link',
+            [f'{dimension}_id', sa.text('campaign_date DESC'), sa.text('id DESC')], unique=False,
+        )
+    op.create_index(
+        'ix_link_target_url_pattern', 'link', ['target_url'], unique=False,
+        postgresql_ops={'target_url': 'varchar_pattern_ops'},
+    )
+
+
+def _replace_link_table(partitioned: bool) -> None:
+    '''Move every link into a new `link` table; the old one is dropped.
+
+    Partitioned link ids are unique only with campaign_date, so nothing can
+    reference them, and short codes are unique per partition only.
+    '''
+    if partitioned:
+        op.drop_constraint('click_link_id_fkey', 'click', type_='foreignkey')
+        op.drop_constraint('click_daily_link_id_fkey', 'click_daily', type_='foreignkey')
+    op.execute('ALTER SEQUENCE link_id_seq OWNED BY NONE')
+    op.rename_table('link', 'link_old')
+    op.execute('ALTER TABLE link_old RENAME CONSTRAINT link_pkey TO link_old_pkey')
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for foreign_key in inspector.get_foreign_keys('link_old'):
+        op.drop_constraint(foreign_key['name'], 'link_old', type_='foreignkey')
+    for index in inspector.get_indexes('link_old'):
+        op.drop_index(index['name'], table_name='link_old')
+
+    _create_link_table('link', partitioned)
+    if partitioned:
+        first = bind.scalar(sa.text('SELECT min(campaign_date) FROM link_old')) or datetime.now()
+        month = first.date().replace(day=1)
+        last = _add_months(datetime.now().date().replace(day=1), MONTHS_AHEAD)
+        while month <= last:
+            name = f'link_p{month:%Y%m}'
+            op.execute(
+                f"CREATE TABLE {name} PARTITION OF link FOR VALUES FROM ('{month}') TO ('{_add_months(month, 1)}')"
+            )
+            op.execute(f'CREATE UNIQUE INDEX ix_{name}_short_code ON {name} (short_code)')
+            month = _add_months(month, 1)
+    op.execute(f'INSERT INTO link ({COLUMNS}) SELECT {COLUMNS} FROM link_old')
+    op.drop_table('link_old')
+    op.execute('ALTER SEQUENCE link_id_seq OWNED BY link.id')
+
+    _create_link_indexes()
+    if not partitioned:
+        op.create_index(op.f('ix_link_short_code'), 'link', ['short_code'], unique=True)
+        op.create_foreign_key('click_link_id_fkey', 'click', 'link', ['link_id'], ['id'])
+        op.create_foreign_key('click_daily_link_id_fkey', 'click_daily', 'link', ['link_id'], ['id'])
+
+
+def upgrade() -> None:
+    _replace_link_table(partitioned=True)
+
+
+def downgrade() -> None:
+    _replace_link_table(partitioned=False)
@@ -0,0 +1,59 @@
+"""unique option names
+
+Revision ID: 8c4e6a1f0d23
+Revises: 5d1f3c2a9b7e
+Create Date: 2026-10-18 11:02:17.540918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4e6a1f0d23'
+down_revision: Union[str, None] = '5d1f3c2a9b7e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+OPTION_TABLES = ['campaign_project', 'content', 'medium', 'source', 'term_material', 'term_page', 'user']
+
+
+def _merge_duplicates(table: str) -> None:
+    '''Point references to the lowest id of each name and drop the other rows.'''
+    duplicates = f'''
+        SELECT id, min(id) OVER (PARTITION BY name) AS keep_id FROM "{table}"
+    '''
+    references = [('link', f'{table}_id')]
+    if table in ('medium', 'source'):
+        references.append(('medium_source', f'{table}_id'))
+    for referencing_table, fk in references:
+        op.execute(f'''
+            UPDATE {referencing_table} SET {fk} = d.keep_id
+            FROM ({duplicates}) d
+            WHERE {referencing_table}.{fk} = d.id AND d.id <> d.keep_id
+        ''')
+    op.execute(f'''
+        DELETE FROM "{table}" WHERE id IN (
+            SELECT id FROM ({duplicates}) d WHERE d.id <> d.keep_id
+        )
+    ''')
+
+
+def upgrade() -> None:
+    for table in OPTION_TABLES:
+        _merge_duplicates(table)
+        op.create_index(op.f(f'ix_{table}_name'), table, ['name'], unique=True)
+
+    op.execute('''
+        DELETE FROM medium_source a USING medium_source b
+        WHERE a.ctid > b.ctid AND a.medium_id = b.medium_id AND a.source_id = b.source_id
+    ''')
+    op.create_index('ix_medium_source_medium_id_source_id', 'medium_source', ['medium_id', 'source_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_medium_source_medium_id_source_id', table_name='medium_source')
+    for table in OPTION_TABLES:
+        op.drop_index(op.f(f'ix_{table}_name'), table_name=table)
@@ -0,0 +1,29 @@
+"""taxonomy decayed at
+
+Revision ID: a3f08b6d2c41
+Revises: 2b7d9e4c5a10
+Create Date: 2026-10-18 12:36:52.804113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f08b6d2c41'
+down_revision: Union[str, None] = '2b7d9e4c5a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'taxonomy_version',
+        sa.Column('decayed_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('taxonomy_version', 'decayed_at')
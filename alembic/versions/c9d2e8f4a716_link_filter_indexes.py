@@ -0,0 +1,38 @@
+"""link filter indexes
+
+Revision ID: c9d2e8f4a716
+Revises: 4f92d7a1c6e5
+Create Date: 2026-10-18 15:20:47.913305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9d2e8f4a716'
+down_revision: Union[str, None] = '4f92d7a1c6e5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FILTER_DIMENSIONS = ['term_material', 'term_page', 'medium', 'source', 'campaign_project', 'user']
+
+
+def upgrade() -> None:
+    for dimension in FILTER_DIMENSIONS:
+        op.create_index(
+            f'ix_link_{dimension}_id_campaign_date_id', 'link',
+            [f'{dimension}_id', sa.text('campaign_date DESC'), sa.text('id DESC')], unique=False,
+        )
+    op.create_index(
+        'ix_link_target_url_pattern', 'link', ['target_url'], unique=False,
+        postgresql_ops={'target_url': 'varchar_pattern_ops'},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_link_target_url_pattern', table_name='link')
+    for dimension in FILTER_DIMENSIONS:
+        op.drop_index(f'ix_link_{dimension}_id_campaign_date_id', table_name='link')
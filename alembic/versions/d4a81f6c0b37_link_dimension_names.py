@@ -0,0 +1,38 @@
+"""link dimension names
+
+Revision ID: d4a81f6c0b37
+Revises: 7a5c3e1b9d42
+Create Date: 2026-10-18 17:35:26.480193
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a81f6c0b37'
+down_revision: Union[str, None] = '7a5c3e1b9d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DIMENSIONS = ['term_material', 'term_page', 'medium', 'source', 'campaign_project', 'content', 'user']
+
+
+def upgrade() -> None:
+    for dimension in DIMENSIONS:
+        op.add_column('link', sa.Column(f'{dimension}_name', sa.String(), nullable=True))
+    # One pass over link for all dimensions.
+    op.execute(f'''
+        UPDATE link SET {", ".join(f'{dimension}_name = "{dimension}".name' for dimension in DIMENSIONS)}
+        FROM {", ".join(f'"{dimension}"' for dimension in DIMENSIONS)}
+        WHERE {" AND ".join(f'"{dimension}".id = link.{dimension}_id' for dimension in DIMENSIONS)}
+    ''')
+    for dimension in DIMENSIONS:
+        op.alter_column('link', f'{dimension}_name', nullable=False)
+
+
+def downgrade() -> None:
+    for dimension in DIMENSIONS:
+        op.drop_column('link', f'{dimension}_name')
@@ -0,0 +1,26 @@
+"""link short url
+
+Revision ID: e58d0a4c7b92
+Revises: b3e9f25c8a17
+Create Date: 2026-10-18 20:41:09.118734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e58d0a4c7b92'
+down_revision: Union[str, None] = 'b3e9f25c8a17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('link', sa.Column('short_url', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('link', 'short_url')
@@ -0,0 +1,32 @@
+"""link short code
+
+Revision ID: e71c5b93f4a8
+Revises: a3f08b6d2c41
+Create Date: 2026-10-18 13:20:09.671355
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e71c5b93f4a8'
+down_revision: Union[str, None] = 'a3f08b6d2c41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('link', sa.Column('short_code', sa.String(), nullable=True))
+    # Existing links get '_<hex id>': unique, and never equal to a random
+    # alphanumeric code.
+    op.execute("UPDATE link SET short_code = '_' || to_hex(id)")
+    op.alter_column('link', 'short_code', nullable=False)
+    op.create_index(op.f('ix_link_short_code'), 'link', ['short_code'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_link_short_code'), table_name='link')
+    op.drop_column('link', 'short_code')
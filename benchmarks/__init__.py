@@ -0,0 +1 @@
+"""Benchmarks of the link_dealer hot paths."""
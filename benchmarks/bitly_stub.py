@@ -0,0 +1,65 @@
+'''A local stand-in for the Bitly shorten API, to run link_dealer.bitly against.
+
+    python -m benchmarks.bitly_stub --port 8100 --latency 0.05 --error-rate 0.1
+    TOKEN_BITLY=stub BITLY_API_URL=http://127.0.0.1:8100/v4 gunicorn link_dealer.main:app
+
+POST /v4/shorten answers {"link": "https://bit.ly/<hash>"} after --latency
+seconds, the hash being derived from long_url so results are reproducible.
+A share of --error-rate requests fails with 429 (with Retry-After) or 503.
+GET /stats tells the requests served and the most in flight at once.
+'''
+import argparse
+import asyncio
+import random
+from hashlib import blake2b
+
+import uvicorn
+from fastapi import FastAPI, Header, HTTPException, Response
+from pydantic import BaseModel
+
+
+class Shorten(BaseModel):
+    long_url: str
+
+
+def create_app(latency: float, error_rate: float) -> FastAPI:
+    app = FastAPI()
+    stats = {'requests': 0, 'errors': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    @app.post('/v4/shorten')
+    async def shorten(data: Shorten, response: Response, authorization: str = Header('')):
+        if not authorization.startswith('Bearer '):
+            raise HTTPException(status_code=403, detail='FORBIDDEN')
+        stats['requests'] += 1
+        stats['in_flight'] += 1
+        stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            stats['in_flight'] -= 1
+        if random.random() < error_rate:
+            stats['errors'] += 1
+            if random.random() < 0.5:
+                raise HTTPException(status_code=429, detail='RATE_LIMIT_EXCEEDED', headers={'Retry-After': '0.1'})
+            raise HTTPException(status_code=503, detail='TEMPORARILY_UNAVAILABLE')
+        response.status_code = 201
+        return {'link': f'https://bit.ly/{blake2b(data.long_url.encode(), digest_size=5).hexdigest()}'}
+
+    @app.get('/stats')
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failing with 429 or 503')
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.error_rate), port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+'''Compare two result files of benchmarks.run.
+
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+
+Exits with 1 if a p50 latency or the queries per call grew by more than
+--threshold.
+'''
+import argparse
+import json
+import sys
+from pathlib import Path
+
+METRICS = ('p50_ms', 'p99_ms', 'queries_per_call', 'rows_per_call')
+GATED = ('p50_ms', 'queries_per_call')
+
+
+def _change(old: float, new: float) -> float:
+    if old == 0:
+        return 0.0 if new == 0 else float('inf')
+    return new / old - 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline', type=Path)
+    parser.add_argument('current', type=Path)
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative growth, 0.1 is 10%%')
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text())
+    current = json.loads(args.current.read_text())
+    print(f'{baseline["meta"]["commit"]} -> {current["meta"]["commit"]}')
+
+    regressions = []
+    for size, benchmarks in current['results'].items():
+        for name, result in benchmarks.items():
+            old = baseline['results'].get(size, {}).get(name)
+            if old is None:
+                print(f'{size:>7} {name:<22} new')
+                continue
+            cells = []
+            for metric in METRICS:
+                change = _change(old[metric], result[metric])
+                cells.append(f'{metric} {old[metric]:.2f} -> {result[metric]:.2f} ({change:+.0%})')
+                if metric in GATED and change > args.threshold:
+                    regressions.append(f'{size} {name} {metric}')
+            print(f'{size:>7} {name:<22} ' + '  '.join(cells))
+
+    if regressions:
+        print('Regressions: ' + ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+'''Benchmark the db_tools hot paths against a throwaway Postgres database.
+
+The database in BENCH_DATABASE_URL is wiped and migrated to head for every
+taxonomy size, so never point it at real data:
+
+    BENCH_DATABASE_URL=postgres://user@localhost/link_dealer_bench \
+        python -m benchmarks.run --sizes 10 1000 50000 --links 10000
+
+Each size gets that many options per dimension (mediums are capped at
+MAX_MEDIUMS, every source belongs to one medium). Results go to
+benchmarks/results/<commit>.json; diff two of them with benchmarks.compare.
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+
+if not os.environ.get('BENCH_DATABASE_URL'):
+    sys.exit('BENCH_DATABASE_URL is not set; it must point to a database that may be wiped')
+os.environ['DATABASE_URL'] = os.environ['BENCH_DATABASE_URL']
+
+from alembic import command  # noqa: E402
+from alembic.config import Config  # noqa: E402
+from sqlalchemy import event, text  # noqa: E402
+
+from link_dealer import db, db_tools, schemas  # noqa: E402
+
+ROOT_PATH = Path(__file__).resolve().parent.parent
+RESULTS_PATH = ROOT_PATH / 'benchmarks' / 'results'
+MAX_MEDIUMS = 20
+LINK_BATCH_SIZE = 1000
+
+
+class QueryCounter:
+    '''Count statements and fetched rows on the sync engine.'''
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.queries += 1
+        if cursor.description is not None and cursor.rowcount > 0:
+            self.rows += cursor.rowcount
+
+    def reset(self):
+        self.queries = 0
+        self.rows = 0
+
+
+def _reset_database():
+    '''Drop everything and migrate to head.'''
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP SCHEMA public CASCADE'))
+        conn.execute(text('CREATE SCHEMA public'))
+    config = Config(str(ROOT_PATH / 'alembic.ini'))
+    config.set_main_option('script_location', str(ROOT_PATH / 'alembic'))
+    command.upgrade(config, 'head')
+    db.engine.dispose()
+    db_tools._info_snapshot = None
+
+
+def _taxonomy(size: int) -> schemas.Info:
+    '''Taxonomy with `size` options per dimension.'''
+    def options(prefix: str) -> list[schemas.BaseOption]:
+        return [schemas.BaseOption(value=f'{prefix}{i}') for i in range(size)]
+
+    mediums = min(size, MAX_MEDIUMS)
+    return schemas.Info(
+        users=[schemas.User(value=f'user{i}', is_bot=i % 10 == 0) for i in range(size)],
+        term_materials=options('material'),
+        term_pages=options('page'),
+        mediums=[
+            schemas.Medium(value=f'medium{m}', sources=[
+                schemas.BaseOption(value=f'source{i}') for i in range(m, size, mediums)
+            ])
+            for m in range(mediums)
+        ],
+        campaign_projects=options('project'),
+        contents=[schemas.BaseOption(value='0'), *options('content')],
+    )
+
+
+def _link_factory(info: schemas.Info, seed: int) -> Callable[[], schemas.LinkCreate]:
+    '''Make random valid link requests, half by name and half by id.'''
+    rnd = random.Random(seed)
+    pairs = [(medium, source) for medium in info.mediums for source in medium.sources]
+
+    def ref(option: schemas.BaseOption) -> int | str:
+        return option.ident if rnd.random() < 0.5 else option.value
+
+    def make() -> schemas.LinkCreate:
+        medium, source = rnd.choice(pairs)
+        return schemas.LinkCreate(
+            target_url=f'https://example.com/page/{rnd.randrange(1000)}?ref=bench',
+            source=ref(source),
+            medium=ref(medium),
+            campaign_project=ref(rnd.choice(info.campaign_projects)),
+            content=ref(rnd.choice(info.contents)),
+            term_material=ref(rnd.choice(info.term_materials)),
+            term_page=ref(rnd.choice(info.term_pages)),
+            user=ref(rnd.choice(info.users)),
+        )
+    return make
+
+
+def _measure(counter: QueryCounter, func: Callable, repeat: int, setup: Callable | None = None) -> dict:
+    '''Call func `repeat` times; latency in ms, queries and rows per call.'''
+    timings = []
+    queries = rows = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        counter.reset()
+        started = perf_counter()
+        func()
+        timings.append((perf_counter() - started) * 1000)
+        queries += counter.queries
+        rows += counter.rows
+
+    timings.sort()
+
+    def percentile(p: float) -> float:
+        return timings[min(int(len(timings) * p), len(timings) - 1)]
+
+    return {
+        'calls': repeat,
+        'mean_ms': statistics.fmean(timings),
+        'min_ms': timings[0],
+        'p50_ms': percentile(0.5),
+        'p90_ms': percentile(0.9),
+        'p99_ms': percentile(0.99),
+        'max_ms': timings[-1],
+        'queries_per_call': queries / repeat,
+        'rows_per_call': rows / repeat,
+    }
+
+
+def _drop_snapshot():
+    db_tools._info_snapshot = None
+
+
+def run_size(counter: QueryCounter, size: int, links: int, repeat: int, seed: int) -> dict:
+    '''Run every benchmark on a fresh database with the given taxonomy size.'''
+    _reset_database()
+    db_tools.update_info(_taxonomy(size))
+    info = db_tools.get_info()
+    make_link = _link_factory(info, seed)
+    for start in range(0, links, LINK_BATCH_SIZE):
+        db_tools.create_links([make_link() for _ in range(min(LINK_BATCH_SIZE, links - start))])
+    cursor = db_tools.get_last_links(100).next_cursor
+
+    # Each update adds one content, so the insert path is measured too.
+    added = iter(range(sys.maxsize))
+
+    def update_info():
+        db_tools.update_info(info.model_copy(update={
+            'contents': [*info.contents, schemas.BaseOption(value=f'bench{next(added)}')],
+        }))
+
+    slow_repeat = max(repeat // 20, 3)
+    results = {
+        'get_info': _measure(counter, db_tools.get_info, repeat, setup=_drop_snapshot),
+        'get_info_cached': _measure(counter, db_tools.get_info, repeat),
+        'update_info': _measure(counter, update_info, slow_repeat),
+        'create_link': _measure(counter, lambda: db_tools.create_link(make_link()), repeat),
+        'create_links_100': _measure(
+            counter, lambda: db_tools.create_links([make_link() for _ in range(100)]), slow_repeat
+        ),
+        'get_last_links': _measure(counter, db_tools.get_last_links, repeat),
+        'get_last_links_cursor': _measure(counter, lambda: db_tools.get_last_links(10, cursor), repeat),
+    }
+    for name, result in results.items():
+        print(
+            f'{size:>7} {name:<22} p50 {result["p50_ms"]:8.2f} ms  p99 {result["p99_ms"]:8.2f} ms'
+            f'  {result["queries_per_call"]:6.1f} q/call  {result["rows_per_call"]:9.1f} rows/call'
+        )
+    return results
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_PATH, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 50000], help='options per dimension')
+    parser.add_argument('--links', type=int, default=10000, help='links created before measuring')
+    parser.add_argument('--repeat', type=int, default=200, help='calls per benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', type=Path, help='result file, benchmarks/results/<commit>.json by default')
+    args = parser.parse_args()
+
+    counter = QueryCounter()
+    commit = _commit()
+    with db.engine.connect() as conn:
+        server_version = conn.scalar(text('SHOW server_version'))
+    report = {
+        'meta': {
+            'commit': commit,
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'postgres': server_version,
+            'links': args.links,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': {
+            str(size): run_size(counter, size, args.links, args.repeat, args.seed) for size in args.sizes
+        },
+    }
+
+    path = args.save or RESULTS_PATH / f'{commit}.json'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2))
+    print(f'Saved {path}')
+
+
+if __name__ == '__main__':
+    main()
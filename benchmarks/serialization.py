@@ -0,0 +1,97 @@
+'''Benchmark the encoding of link lists, per row, without a database.
+
+    python -m benchmarks.serialization --rows 10 100 1000
+
+`response_model` is the path list endpoints used to take: a validated
+schemas.Link per row, FastAPI's validation against response_model, its
+jsonable_encoder and json.dumps. `direct` is the current one: row dicts
+encoded by pydantic-core through service.json_response. Both start from
+the same row mappings and must produce the same bytes.
+'''
+import argparse
+import asyncio
+import statistics
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Callable
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from link_dealer import schemas
+from link_dealer.api import service
+
+DIMENSIONS = ('term_material', 'term_page', 'medium', 'source', 'campaign_project', 'content', 'user')
+
+
+def _rows(count: int) -> list[dict]:
+    '''Rows shaped like the ones of db_tools._link_select().'''
+    started = datetime(2024, 1, 1)
+    rows = []
+    for i in range(count):
+        row = {
+            'id': i,
+            'target_url': f'https://example.com/page/{i}',
+            'campaign_date': started + timedelta(minutes=i),
+            'campaign_dop': '0',
+            'full_url': (
+                f'https://example.com/page/{i}?utm_source=source&utm_medium=medium'
+                f'&utm_campaign=project-20240101-0&utm_content=content&utm_term=material-page-0'
+            ),
+            'short_code': f'aa{i:07d}',
+            'short_url': None,
+        }
+        for dimension in DIMENSIONS:
+            row[f'{dimension}_id'] = i % 50
+            row[f'{dimension}_name'] = f'{dimension} {i % 50}'
+        rows.append(row)
+    return rows
+
+
+def _response_model(field, loop: asyncio.AbstractEventLoop) -> Callable[[list[dict]], bytes]:
+    def encode(rows: list[dict]) -> bytes:
+        page = schemas.LastLinks(links=[schemas.Link(**row) for row in rows], next_cursor='cursor')
+        content = loop.run_until_complete(serialize_response(field=field, response_content=page, is_coroutine=True))
+        return JSONResponse(content).body
+    return encode
+
+
+def _direct(rows: list[dict]) -> bytes:
+    return service.json_response({'links': [dict(row) for row in rows], 'next_cursor': 'cursor'}).body
+
+
+def _measure(encode: Callable[[list[dict]], bytes], rows: list[dict], repeat: int) -> float:
+    '''Median microseconds per row over `repeat` encodings.'''
+    encode(rows)
+    timings = []
+    for _ in range(repeat):
+        started = perf_counter()
+        encode(rows)
+        timings.append(perf_counter() - started)
+    return statistics.median(timings) / len(rows) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 1000], help='links per response')
+    parser.add_argument('--repeat', type=int, default=50, help='encodings per measurement')
+    args = parser.parse_args()
+
+    response_model = _response_model(
+        create_response_field(name='Response_last_links', type_=schemas.LastLinks), asyncio.new_event_loop()
+    )
+    for count in args.rows:
+        rows = _rows(count)
+        if response_model(rows) != _direct(rows):
+            raise SystemExit(f'Encodings of {count} rows differ')
+        before = _measure(response_model, rows, args.repeat)
+        after = _measure(_direct, rows, args.repeat)
+        print(
+            f'{count:>6} rows  response_model {before:7.2f} us/row  direct {after:7.2f} us/row'
+            f'  {before / after:5.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+from os import environ
+
+from prometheus_client import multiprocess
+
+workers = int(environ.get('WEB_CONCURRENCY', '4'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+# Import the app once in the master; workers fork with it built.
+preload_app = environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+
+def child_exit(server, worker):
+    if environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
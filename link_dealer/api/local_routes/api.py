@@ -2,12 +2,16 @@ import json
 import os
 import secrets
 from datetime import datetime
+from typing import Literal, Optional
 from urllib.parse import urlparse
 from loguru import logger
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from link_dealer import schemas, db_tools
+from link_dealer import clicks, db, idempotency, schemas, db_tools, search
+from link_dealer.api import service
 
 
 router = APIRouter()
@@ -18,10 +22,9 @@ password = os.environ.get('API_PASSWORD', 'pass')
 subscription_url = os.environ.get('SUB_URL', 'subscription_url')
 main_url = os.environ.get('MAIN_URL', 'main_url')
 utm_cattegories = json.loads(os.environ.get('UTM_CATS', '{}'))
-TOKEN_BITLY = os.environ.get('TOKEN_BITLY', '')
 
 
-def get_current_username(credentials: HTTPBasicCredentials = Depends(security)):
+async def get_current_username(credentials: HTTPBasicCredentials = Depends(security)):
     correct_username = secrets.compare_digest(credentials.username, username)
     correct_password = secrets.compare_digest(credentials.password, password)
     if not (correct_username and correct_password):
@@ -35,26 +38,151 @@ def get_current_username(credentials: HTTPBasicCredentials = Depends(security)):
 
 @logger.catch
 @router.get('/info', response_model=schemas.Info, tags=['api'])
-def info(_: str = Depends(get_current_username)) -> schemas.Info:
-    return db_tools.get_info()
+async def info(request: Request, _: str = Depends(get_current_username)) -> Response:
+    snapshot = db_tools.cached_info_snapshot()
+    if snapshot is None:
+        if db.ASYNC_DB:
+            snapshot = await db_tools.get_info_snapshot_async()
+        else:
+            snapshot = await run_in_threadpool(db_tools.get_info_snapshot)
+    version, data = snapshot
+    return await service.cached_json_response(request, 'info', version, data)
+
+
+@logger.catch
+@router.get('/options/{kind}/search', response_model=list[schemas.BaseOption], tags=['api'])
+async def search_options(
+    kind: search.Kind,
+    q: str = Query('', max_length=200),
+    limit: int = Query(10, ge=1, le=100),
+    medium: Optional[int] = None,
+    _: str = Depends(get_current_username),
+) -> list[schemas.BaseOption]:
+    snapshot = db_tools.cached_info_snapshot()
+    if snapshot is None:
+        if db.ASYNC_DB:
+            snapshot = await db_tools.get_info_snapshot_async()
+        else:
+            snapshot = await run_in_threadpool(db_tools.get_info_snapshot)
+    version, data = snapshot
+    index = search.cached_index(version)
+    if index is None:
+        index = await run_in_threadpool(search.get_index, version, data)
+    return index.search(kind, q, limit, medium)
 
 
 @logger.catch
 @router.post('/update_info', response_model=schemas.Info, tags=['api'])
-def update_info(data: schemas.Info, _: str = Depends(get_current_username)) -> schemas.Info:
-    db_tools.update_info(data)
-    return db_tools.get_info()
+async def update_info(data: schemas.Info, _: str = Depends(get_current_username)) -> schemas.Info:
+    try:
+        if db.ASYNC_DB:
+            return await db_tools.update_info_async(data)
+        return await run_in_threadpool(db_tools.update_info, data)
+    except ValueError as err:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err))
 
 
 @logger.catch
 @router.post('/create_link', response_model=schemas.Link, tags=['api'])
-def create_link(data: schemas.LinkCreate, _: str = Depends(get_current_username)) -> schemas.Link:
-    link = db_tools.create_link(data)
-    return link
+async def create_link(
+    data: schemas.LinkCreate,
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=idempotency.MAX_KEY_LENGTH),
+    _: str = Depends(get_current_username),
+) -> Response:
+    try:
+        link = idempotency.cached_link(idempotency_key, data) if idempotency_key else None
+        if link is None:
+            if db.ASYNC_DB:
+                link = await db_tools.create_link_async(data, idempotency_key)
+            else:
+                link = await run_in_threadpool(db_tools.create_link, data, idempotency_key)
+    except ValueError as err:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err))
+    return service.json_response(link)
+
+
+@logger.catch
+@router.post('/create_links', response_model=schemas.CreatedLinks, tags=['api'])
+async def create_links(data: list[schemas.LinkCreate], _: str = Depends(get_current_username)) -> Response:
+    if db.ASYNC_DB:
+        created = await db_tools.create_links_async(data)
+    else:
+        created = await run_in_threadpool(db_tools.create_links, data)
+    return service.json_response(created)
+
+
+@logger.catch
+@router.post('/preview_links', tags=['api'])
+async def preview_links(data: schemas.PreviewLinks, _: str = Depends(get_current_username)) -> StreamingResponse:
+    try:
+        if db.ASYNC_DB:
+            batches = await db_tools.preview_links_async(data)
+        else:
+            batches = await run_in_threadpool(db_tools.preview_links, data)
+    except ValueError as err:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err))
+    return StreamingResponse(service.ndjson_chunks(batches), media_type='application/x-ndjson')
 
 
 @logger.catch
 @router.get('/last_links', response_model=schemas.LastLinks, tags=['api'])
-def last_links(_: str = Depends(get_current_username)) -> schemas.LastLinks:
-    links = db_tools.get_last_links()
-    return links
+async def last_links(
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    _: str = Depends(get_current_username),
+) -> Response:
+    try:
+        if db.ASYNC_DB:
+            page = await db_tools.get_last_links_async(limit, cursor)
+        else:
+            page = await run_in_threadpool(db_tools.get_last_links, limit, cursor)
+    except ValueError as err:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err))
+    return service.json_response(page._asdict())
+
+
+@logger.catch
+@router.get('/links', response_model=schemas.LastLinks, tags=['api'])
+async def links(
+    filters: schemas.LinkFilter = Depends(),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    _: str = Depends(get_current_username),
+) -> Response:
+    try:
+        if db.ASYNC_DB:
+            page = await db_tools.get_links_async(filters, limit, cursor)
+        else:
+            page = await run_in_threadpool(db_tools.get_links, filters, limit, cursor)
+    except ValueError as err:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err))
+    return service.json_response(page._asdict())
+
+
+@logger.catch
+@router.post(
+    '/clicks', response_model=schemas.ClicksAccepted, status_code=status.HTTP_202_ACCEPTED, tags=['api']
+)
+async def add_clicks(data: schemas.ClickBatch, _: str = Depends(get_current_username)) -> schemas.ClicksAccepted:
+    try:
+        accepted = clicks.add(data.clicks)
+    except clicks.BufferFull as err:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(err))
+    return schemas.ClicksAccepted(accepted=accepted, rejected=len(data.clicks) - accepted)
+
+
+@logger.catch
+@router.get('/links/export', tags=['api'])
+async def export_links(
+    export_format: Literal['ndjson', 'csv'] = Query('ndjson', alias='format'),
+    since: Optional[datetime] = None,
+    _: str = Depends(get_current_username),
+) -> StreamingResponse:
+    batches = db_tools.iter_link_batches(since)
+    if export_format == 'csv':
+        return StreamingResponse(
+            service.csv_chunks(batches),
+            media_type='text/csv',
+            headers={'Content-Disposition': 'attachment; filename="links.csv"'},
+        )
+    return StreamingResponse(service.ndjson_chunks(batches), media_type='application/x-ndjson')
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Response
+from fastapi.concurrency import run_in_threadpool
+from link_dealer import metrics
+
+
+router = APIRouter()
+
+
+@router.get('/metrics', include_in_schema=False)
+async def get_metrics() -> Response:
+    if metrics.MULTIPROCESS:
+        body, content_type = await run_in_threadpool(metrics.render)
+    else:
+        body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
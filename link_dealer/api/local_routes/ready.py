@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response, status
+from link_dealer import startup
+
+
+router = APIRouter()
+
+
+@router.get('/ready', include_in_schema=False)
+async def ready() -> Response:
+    if not startup.ready and not await startup.warm_up():
+        return Response('warming up', status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response('ready')
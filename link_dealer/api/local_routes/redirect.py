@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException, Path, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse
+from link_dealer import db, db_tools, models
+
+
+router = APIRouter()
+
+
+@router.get('/r/{code}', response_class=RedirectResponse, status_code=status.HTTP_302_FOUND, tags=['redirect'])
+async def redirect(code: str = Path(max_length=2 * models.SHORT_CODE_LENGTH)) -> RedirectResponse:
+    full_url = db_tools.cached_full_url(code)
+    if full_url is None:
+        if db.ASYNC_DB:
+            full_url = await db_tools.get_full_url_async(code)
+        else:
+            full_url = await run_in_threadpool(db_tools.get_full_url, code)
+    if full_url is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Link not found')
+    return RedirectResponse(full_url, status_code=status.HTTP_302_FOUND)
@@ -1,6 +1,9 @@
 from fastapi import APIRouter
-from link_dealer.api.local_routes import api
+from link_dealer.api.local_routes import api, metrics, ready, redirect
 
 routes = APIRouter()
 
 routes.include_router(api.router, prefix='/api')
+routes.include_router(redirect.router)
+routes.include_router(metrics.router)
+routes.include_router(ready.router)
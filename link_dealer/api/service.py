@@ -0,0 +1,133 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+from hashlib import sha256
+from typing import Any, Hashable, Iterable, Iterator, Mapping, Sequence
+
+import brotli
+import pydantic_core
+from fastapi import Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy import RowMapping
+
+from link_dealer import schemas
+
+LINK_FIELDS = list(schemas.Link.model_fields)
+
+COMPRESSORS = {
+    'br': lambda body: brotli.compress(body, quality=9),
+    'gzip': lambda body: gzip.compress(body, compresslevel=9),
+}
+
+# key -> (data version, etag, bodies by content coding); only the latest version is kept.
+_encoded_responses: dict[str, tuple[Hashable, str, dict[str, bytes]]] = {}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def ndjson_chunks(batches: Iterable[Sequence[Mapping[Any, Any]]]) -> Iterator[str]:
+    '''Encode batches of link rows or preview links as NDJSON, one chunk per batch.'''
+    for batch in batches:
+        yield ''.join(json.dumps(dict(row), default=_json_default) + '\n' for row in batch)
+
+
+def csv_chunks(batches: Iterable[list[RowMapping]]) -> Iterator[str]:
+    '''Encode batches of link rows as CSV with a header, one chunk per batch.'''
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=LINK_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def json_response(data, status_code: int = status.HTTP_200_OK) -> Response:
+    '''Answer with data encoded by pydantic-core.
+
+    Skips FastAPI's validation against response_model and its
+    jsonable_encoder pass, so data must already have the declared shape.
+    '''
+    return Response(pydantic_core.to_json(data), status_code=status_code, media_type='application/json')
+
+
+def _accepted_encoding(accept_encoding: str) -> str:
+    '''Pick the content coding to answer with.'''
+    accepted = set()
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(name.strip().lower())
+    for encoding in COMPRESSORS:
+        if encoding in accepted:
+            return encoding
+    return 'identity'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    '''Check If-None-Match against the etag of any content coding of the body.'''
+    base = etag.strip('"')
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/').strip('"').split('-')[0] == base:
+            return True
+    return False
+
+
+def _encoded_response(
+    key: str, version: Hashable, data: BaseModel, encoding: str = 'identity'
+) -> tuple[Hashable, str, dict[str, bytes]]:
+    '''Get the encoded response of a data version, encoding and compressing it if needed.'''
+    entry = _encoded_responses.get(key)
+    if entry is None or entry[0] != version:
+        body = data.model_dump_json().encode()
+        etag = f'"{version}.{sha256(body).hexdigest()[:16]}"'
+        entry = (version, etag, {'identity': body})
+        _encoded_responses[key] = entry
+    bodies = entry[2]
+    if encoding not in bodies:
+        bodies[encoding] = COMPRESSORS[encoding](bodies['identity'])
+    return entry
+
+
+def warm_json_response(key: str, version: Hashable, data: BaseModel):
+    '''Encode and compress a response of cached_json_response ahead of the first request.'''
+    for encoding in COMPRESSORS:
+        _encoded_response(key, version, data, encoding)
+
+
+async def cached_json_response(request: Request, key: str, version: Hashable, data: BaseModel) -> Response:
+    '''Answer with JSON encoded and compressed once per data version.
+
+    Encoding and compression of a new version run in the threadpool, off the
+    event loop. The strong ETag is derived from the version and the encoded
+    body and gets a suffix per content coding. A matching If-None-Match gets
+    a 304.
+    '''
+    encoding = _accepted_encoding(request.headers.get('accept-encoding', ''))
+    entry = _encoded_responses.get(key)
+    if entry is None or entry[0] != version or encoding not in entry[2]:
+        entry = await run_in_threadpool(_encoded_response, key, version, data, encoding)
+    _, etag, bodies = entry
+
+    headers = {
+        'ETag': etag if encoding == 'identity' else f'{etag[:-1]}-{encoding}"',
+        'Vary': 'Accept-Encoding',
+        'Cache-Control': 'no-cache',
+    }
+    if _etag_matches(request.headers.get('if-none-match', ''), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(bodies[encoding], media_type='application/json', headers=headers)
@@ -0,0 +1,224 @@
+'''Background shortening of created links with Bitly.
+
+create_link and create_links queue their links here after commit. A
+PeriodicTask drains the queue every BITLY_FLUSH_INTERVAL seconds, or as soon
+as BITLY_BATCH_SIZE links wait, in batches of BITLY_BATCH_SIZE: the links of
+a batch are shortened through one pooled httpx.AsyncClient, at most
+BITLY_CONCURRENCY requests at a time, and their short urls are written to
+link.short_url with one UPDATE. Rate limits, server and transport errors are
+retried with backoff, waiting at most BITLY_TIMEOUT seconds; links still
+failing go back to the queue, up to BITLY_MAX_FLUSHES flushes. Links Bitly
+refuses or answers unexpectedly for are logged and dropped.
+
+Nothing is queued without TOKEN_BITLY. BITLY_API_URL points the client
+elsewhere, e.g. at benchmarks.bitly_stub.
+'''
+import asyncio
+from datetime import datetime
+from os import environ
+from threading import Lock
+
+import httpx
+from loguru import logger
+from sqlalchemy import DateTime, Integer, String, column, update, values
+
+from link_dealer import db, models
+from link_dealer.tasks import PeriodicTask
+
+TOKEN_BITLY = environ.get('TOKEN_BITLY', '')
+BITLY_API_URL = environ.get('BITLY_API_URL', 'https://api-ssl.bitly.com/v4')
+BITLY_CONCURRENCY = int(environ.get('BITLY_CONCURRENCY', '8'))
+BITLY_BATCH_SIZE = int(environ.get('BITLY_BATCH_SIZE', '100'))
+BITLY_FLUSH_INTERVAL = float(environ.get('BITLY_FLUSH_INTERVAL', '2'))
+BITLY_QUEUE_LIMIT = int(environ.get('BITLY_QUEUE_LIMIT', '100000'))
+BITLY_RETRIES = int(environ.get('BITLY_RETRIES', '4'))
+BITLY_TIMEOUT = float(environ.get('BITLY_TIMEOUT', '10'))
+BITLY_MAX_FLUSHES = int(environ.get('BITLY_MAX_FLUSHES', '5'))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# (link id, campaign date, full url, flushes tried) waiting to be shortened,
+# for this worker.
+_queue: list[tuple[int, datetime, str, int]] = []
+_lock = Lock()
+_flusher: PeriodicTask | None = None
+# Event loop and client of the flusher thread, kept between flushes so that
+# connections are reused.
+_loop: asyncio.AbstractEventLoop | None = None
+_client: httpx.AsyncClient | None = None
+
+
+class TransientError(Exception):
+    '''Bitly could not shorten a link for now.'''
+
+
+def make_flusher() -> PeriodicTask:
+    '''Make the task that shortens queued links on time or when a batch is full.'''
+    global _flusher
+    _flusher = PeriodicTask(flush, BITLY_FLUSH_INTERVAL)
+    return _flusher
+
+
+def enqueue(links: list[tuple[int, datetime, str]]):
+    '''Queue (link id, campaign date, full url) of created links for shortening.'''
+    if not TOKEN_BITLY or not links:
+        return
+    with _lock:
+        room = max(BITLY_QUEUE_LIMIT - len(_queue), 0)
+        _queue.extend((*link, 0) for link in links[:room])
+        size = len(_queue)
+    if room < len(links):
+        logger.warning(f'Bitly queue is full, {len(links) - room} links will not be shortened')
+    if size >= BITLY_BATCH_SIZE and _flusher:
+        _flusher.wake()
+
+
+def _retry_delay(response: httpx.Response | None, attempt: int) -> float:
+    '''Seconds to wait before a retry: Retry-After if given, else exponential backoff.
+
+    Never more than BITLY_TIMEOUT, so a long Retry-After cannot hold the
+    flusher, and the shutdown waiting for it, for that long.
+    '''
+    delay = 0.5 * 2 ** attempt
+    if response is not None:
+        try:
+            retry_after = float(response.headers['retry-after'])
+        except (KeyError, ValueError):
+            pass
+        else:
+            if retry_after >= 0:
+                delay = retry_after
+    return min(delay, BITLY_TIMEOUT)
+
+
+async def _shorten(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, full_url: str) -> str | None:
+    '''Short url of full_url, or None if Bitly refuses it.'''
+    for attempt in range(BITLY_RETRIES + 1):
+        response = None
+        async with semaphore:
+            try:
+                response = await client.post('shorten', json={'long_url': full_url})
+            except httpx.TransportError as err:
+                error = repr(err)
+            else:
+                if response.is_success:
+                    return response.json()['link']
+                if response.status_code not in RETRY_STATUSES:
+                    logger.warning(f'Bitly refused {full_url}: {response.status_code} {response.text[:200]}')
+                    return None
+                error = f'HTTP {response.status_code}'
+        if attempt < BITLY_RETRIES:
+            await asyncio.sleep(_retry_delay(response, attempt))
+    raise TransientError(error)
+
+
+async def _shorten_batch(
+    client: httpx.AsyncClient, links: list[tuple[int, datetime, str, int]]
+) -> tuple[list[tuple[int, datetime, str]], list[tuple[int, datetime, str, int]]]:
+    '''Shorten a batch concurrently. Return (link id, campaign date, short url) rows and the links to retry.
+
+    A link failing otherwise than with TransientError is logged and dropped,
+    the rest of the batch is kept.
+    '''
+    semaphore = asyncio.Semaphore(BITLY_CONCURRENCY)
+    results = await asyncio.gather(
+        *(_shorten(client, semaphore, full_url) for _, _, full_url, _ in links), return_exceptions=True
+    )
+    shortened = []
+    failed = []
+    for link, result in zip(links, results):
+        if isinstance(result, TransientError):
+            failed.append(link)
+        elif isinstance(result, Exception):
+            logger.opt(exception=result).error(f'Bitly failed to shorten {link[2]}, it is dropped')
+        elif isinstance(result, BaseException):
+            raise result
+        elif result is not None:
+            shortened.append((link[0], link[1], result))
+    if failed:
+        logger.warning(f'Bitly failed to shorten {len(failed)} links, e.g. with {results[links.index(failed[0])]}')
+    return shortened, failed
+
+
+def _write_back(rows: list[tuple[int, datetime, str]]):
+    '''Set short_url of links with one UPDATE.'''
+    shortened = values(
+        column('id', Integer), column('campaign_date', DateTime), column('short_url', String), name='shortened',
+    ).data(rows)
+    table = models.Link.__table__
+    with db.SessionLocal() as session:
+        session.execute(
+            update(table).where(
+                table.c.id == shortened.c.id, table.c.campaign_date == shortened.c.campaign_date,
+            ).values(short_url=shortened.c.short_url)
+        )
+        session.commit()
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=BITLY_API_URL.rstrip('/') + '/',
+            headers={'Authorization': f'Bearer {TOKEN_BITLY}'},
+            timeout=BITLY_TIMEOUT,
+            limits=httpx.Limits(max_connections=BITLY_CONCURRENCY, max_keepalive_connections=BITLY_CONCURRENCY),
+        )
+    return _client
+
+
+def _requeue(links: list[tuple[int, datetime, str, int]]):
+    '''Put links back at the head of the queue, dropping those tried BITLY_MAX_FLUSHES times.'''
+    retry = [(*link[:3], link[3] + 1) for link in links if link[3] + 1 < BITLY_MAX_FLUSHES]
+    if len(retry) < len(links):
+        logger.warning(
+            f'Bitly failed to shorten {len(links) - len(retry)} links in {BITLY_MAX_FLUSHES} flushes, they are dropped'
+        )
+    if retry:
+        with _lock:
+            _queue[:0] = retry[:max(BITLY_QUEUE_LIMIT - len(_queue), 0)]
+
+
+def flush():
+    '''Shorten the queued links batch by batch and write their short urls back.
+
+    Links that could not be shortened or written back go back to the queue.
+    Links not tried yet because of an error are queued again as they were.
+    '''
+    global _loop, _queue
+    with _lock:
+        links, _queue = _queue, []
+    if not links:
+        return
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+
+    retry = []
+    try:
+        for start in range(0, len(links), BITLY_BATCH_SIZE):
+            batch = links[start:start + BITLY_BATCH_SIZE]
+            try:
+                shortened, failed = _loop.run_until_complete(_shorten_batch(_get_client(), batch))
+                if shortened:
+                    _write_back(shortened)
+            except Exception:
+                retry += batch
+                raise
+            retry += failed
+    finally:
+        untried = links[start + BITLY_BATCH_SIZE:]
+        if untried:
+            with _lock:
+                _queue[:0] = untried[:max(BITLY_QUEUE_LIMIT - len(_queue), 0)]
+        _requeue(retry)
+
+
+def close():
+    '''Close the client and the event loop of the flusher, once it is stopped.'''
+    global _client, _loop
+    if _loop is None:
+        return
+    if _client is not None:
+        _loop.run_until_complete(_client.aclose())
+        _client = None
+    _loop.close()
+    _loop = None
@@ -0,0 +1,108 @@
+import io
+from collections import Counter
+from datetime import datetime
+from os import environ
+from threading import Lock
+
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from link_dealer import db, models, schemas
+from link_dealer.tasks import PeriodicTask
+
+CLICK_FLUSH_SIZE = int(environ.get('CLICK_FLUSH_SIZE', '5000'))
+CLICK_FLUSH_INTERVAL = float(environ.get('CLICK_FLUSH_INTERVAL', '5'))
+CLICK_BUFFER_LIMIT = int(environ.get('CLICK_BUFFER_LIMIT', '200000'))
+
+# (link id, full url, clicked at) waiting for the next flush, for this worker.
+_buffer: list[tuple[int | None, str | None, datetime]] = []
+_lock = Lock()
+_flusher: PeriodicTask | None = None
+
+
+class BufferFull(Exception):
+    '''Too many clicks wait for a flush.'''
+
+
+def make_flusher() -> PeriodicTask:
+    '''Make the task that flushes the buffer on time or when it is full.'''
+    global _flusher
+    _flusher = PeriodicTask(flush, CLICK_FLUSH_INTERVAL)
+    return _flusher
+
+
+def add(events: list[schemas.ClickEvent]) -> int:
+    '''Buffer click events. Return how many were accepted.'''
+    now = datetime.now()
+    rows = []
+    for event in events:
+        if event.link_id is None and not event.full_url:
+            continue
+        clicked_at = event.clicked_at or now
+        if clicked_at.tzinfo is not None:
+            clicked_at = clicked_at.astimezone().replace(tzinfo=None)
+        rows.append((event.link_id, event.full_url, clicked_at))
+
+    with _lock:
+        if len(_buffer) + len(rows) > CLICK_BUFFER_LIMIT:
+            raise BufferFull(f'{len(_buffer)} clicks wait for a flush')
+        _buffer.extend(rows)
+        size = len(_buffer)
+    if size >= CLICK_FLUSH_SIZE and _flusher:
+        _flusher.wake()
+    return len(rows)
+
+
+def flush():
+    '''COPY buffered clicks into `click` and add them to `click_daily`.
+
+    Clicks of unknown links are dropped. On failure the clicks go back to
+    the buffer.
+    '''
+    global _buffer
+    with _lock:
+        events, _buffer = _buffer, []
+    if not events:
+        return
+
+    try:
+        with db.SessionLocal() as session:
+            link_ids = {link_id for link_id, _, _ in events if link_id is not None}
+            full_urls = {full_url for link_id, full_url, _ in events if link_id is None}
+            known_ids = set()
+            ids_by_url = {}
+            for link_id, full_url in session.execute(
+                select(models.Link.id, models.Link.full_url).where(
+                    or_(models.Link.id.in_(link_ids), models.Link.full_url.in_(full_urls))
+                )
+            ):
+                known_ids.add(link_id)
+                ids_by_url[full_url] = link_id
+
+            rows = io.StringIO()
+            per_day = Counter()
+            for link_id, full_url, clicked_at in events:
+                if link_id is None:
+                    link_id = ids_by_url.get(full_url)
+                if link_id not in known_ids:
+                    continue
+                rows.write(f'{link_id}\t{clicked_at.isoformat()}\n')
+                per_day[link_id, clicked_at.date()] += 1
+            if not per_day:
+                return
+            rows.seek(0)
+
+            cursor = session.connection().connection.cursor()
+            cursor.copy_expert('COPY click (link_id, clicked_at) FROM STDIN', rows)
+            statement = pg_insert(models.ClickDaily).values([
+                {'link_id': link_id, 'day': day, 'clicks': clicks} for (link_id, day), clicks in per_day.items()
+            ])
+            session.execute(statement.on_conflict_do_update(
+                index_elements=['link_id', 'day'],
+                set_={'clicks': models.ClickDaily.clicks + statement.excluded.clicks},
+            ))
+            session.commit()
+    except Exception:
+        with _lock:
+            _buffer[:0] = events[:max(CLICK_BUFFER_LIMIT - len(_buffer), 0)]
+        raise
@@ -1,302 +1,976 @@
-from link_dealer import db, models, schemas
+from link_dealer import bitly, db, idempotency, models, partitions, schemas, usage
+from link_dealer.cache import LRUCache
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import Counter
 from datetime import datetime
-from urllib.parse import urlparse, parse_qs, urlencode
+from functools import lru_cache
+from os import environ
+from threading import Lock
+from time import monotonic
+from typing import Callable, Iterable, Iterator, Mapping, NamedTuple, Sequence, TypeVar
+from urllib.parse import urlparse, parse_qs, quote_plus, urlencode
+
+from sqlalchemy import (
+    ColumnElement, Integer, Row, RowMapping, Select, String, column, exists, insert, literal, or_, select, tuple_, union_all,
+    update, values,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+
+T = TypeVar('T')
+
+INFO_CACHE_TTL = float(environ.get('INFO_CACHE_TTL', '2'))
+EXPORT_BATCH_SIZE = int(environ.get('EXPORT_BATCH_SIZE', '1000'))
+PREVIEW_MAX_LINKS = int(environ.get('PREVIEW_MAX_LINKS', '100000'))
+SHORT_LINK_CACHE_SIZE = int(environ.get('SHORT_LINK_CACHE_SIZE', '10000'))
+SHORT_CODE_ATTEMPTS = 3
+# Bind parameters per statement; asyncpg allows at most 32767.
+MAX_BIND_PARAMS = 30000
+QUOTE_CACHE_SIZE = 100000
+TEMPLATE_CACHE_SIZE = 10000
+
+# Query parameters set by make_full_url, in the order it sets them.
+UTM_KEYS = ('utm_source', 'utm_medium', 'utm_campaign', 'utm_content', 'utm_term')
+
+# Link dimensions by LinkCreate field; Link stores them as `<field>_id`.
+LINK_DIMENSIONS: dict[str, type[models.Base]] = {
+    'term_material': models.TermMaterial,
+    'term_page': models.TermPage,
+    'medium': models.Medium,
+    'source': models.Source,
+    'campaign_project': models.CampaignProject,
+    'content': models.Content,
+    'user': models.User,
+}
+DIMENSION_BY_MODEL = {model: dimension for dimension, model in LINK_DIMENSIONS.items()}
+# Link filters with a (filter, campaign_date DESC, id DESC) index.
+INDEXED_LINK_FILTERS = (
+    'term_material_id', 'term_page_id', 'medium_id', 'source_id', 'campaign_project_id', 'user_id',
+    'date_from', 'date_to', 'target_url_prefix',
+)
+# Dimensions that make up a utm url.
+PREVIEW_DIMENSIONS = ('term_material', 'term_page', 'medium', 'source', 'campaign_project', 'content')
+
+# short code -> full url; codes never change, so entries are never invalidated.
+_short_links = LRUCache(SHORT_LINK_CACHE_SIZE)
+
+# (taxonomy version, snapshot) shared by all requests of this worker.
+_info_snapshot: tuple[int, schemas.Info] | None = None
+_info_checked_at = 0.0
+_info_lock = Lock()
+
+
+def _batched(items: Sequence[T], params_per_item: int) -> Iterator[Sequence[T]]:
+    '''Split items so that a statement binding params_per_item parameters for each stays under MAX_BIND_PARAMS.'''
+    size = MAX_BIND_PARAMS // params_per_item
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _get_taxonomy_version(session: Session) -> int:
+    '''Get taxonomy version.'''
+    return session.scalar(select(models.TaxonomyVersion.version)) or 0
+
+
+def _bump_taxonomy_version(session: Session) -> int:
+    '''Bump taxonomy version so that every worker rebuilds its snapshot. Return the new version.'''
+    return session.scalar(
+        update(models.TaxonomyVersion).values(version=models.TaxonomyVersion.version + 1)
+        .returning(models.TaxonomyVersion.version)
+    )
+
+
+def _build_info(session: Session) -> schemas.Info:
+    '''Build info snapshot.'''
+    users = session.query(models.User).order_by(models.User.weight.desc(), models.User.id).all()
+    term_materials = session.query(models.TermMaterial).order_by(models.TermMaterial.weight.desc(), models.TermMaterial.id).all()
+    term_pages = session.query(models.TermPage).order_by(models.TermPage.weight.desc(), models.TermPage.id).all()
+    mediums = session.query(models.Medium).options(
+        selectinload(models.Medium.sources)
+    ).order_by(models.Medium.weight.desc(), models.Medium.id).all()
+    campaign_projects = session.query(models.CampaignProject).order_by(models.CampaignProject.weight.desc(), models.CampaignProject.id).all()
+    contents = session.query(models.Content).order_by(models.Content.weight.desc(), models.Content.id).all()
+
+    info = schemas.Info(
+        users=[
+            schemas.User(
+                ident=user.id,
+                value=user.name,
+                is_bot=user.is_bot,
+            )
+            for user in users
+        ],
+        term_materials=[
+            schemas.BaseOption(
+                ident=term_material.id,
+                value=term_material.name,
+            )
+            for term_material in term_materials
+        ],
+        term_pages=[
+            schemas.BaseOption(
+                ident=term_page.id,
+                value=term_page.name,
+            )
+            for term_page in term_pages
+        ],
+        mediums=[
+            schemas.Medium(
+                ident=medium.id,
+                value=medium.name,
+                sources=[
+                    schemas.BaseOption(
+                        ident=source.id,
+                        value=source.name,
+                    )
+                    for source in sorted(medium.sources, key=lambda x: (-x.weight, x.id))
+                ],
+            )
+            for medium in mediums
+        ],
+        campaign_projects=[
+            schemas.BaseOption(
+                ident=campaign_project.id,
+                value=campaign_project.name,
+            )
+            for campaign_project in campaign_projects
+        ],
+        contents=[
+            schemas.BaseOption(
+                ident=content.id,
+                value=content.name,
+            )
+            for content in contents
+        ],
+    )
+    sources = {source.id: source for medium in mediums for source in medium.sources}
+    info._source_order = tuple(
+        source.id for source in sorted(sources.values(), key=lambda x: (-x.weight, x.id))
+    )
+    return info
+
+
+def cached_info_snapshot() -> tuple[int, schemas.Info] | None:
+    '''Get the worker snapshot if its version was checked recently enough.'''
+    snapshot = _info_snapshot
+    if snapshot and monotonic() - _info_checked_at < INFO_CACHE_TTL:
+        return snapshot
+    return None
+
+
+def _store_info(snapshot: tuple[int, schemas.Info]) -> tuple[int, schemas.Info]:
+    '''Keep a snapshot unless the worker already has a newer one. Return the one kept.
+
+    A request may have read the taxonomy before a concurrent update_info
+    committed; its snapshot must not replace the updated one.
+    '''
+    global _info_snapshot, _info_checked_at
+    with _info_lock:
+        if _info_snapshot is None or snapshot[0] >= _info_snapshot[0]:
+            _info_snapshot = snapshot
+        _info_checked_at = monotonic()
+        return _info_snapshot
+
+
+def _refresh_info(session: Session) -> tuple[int, schemas.Info]:
+    '''Check the taxonomy version and rebuild the snapshot if it has changed.'''
+    snapshot = _info_snapshot
+    version = _get_taxonomy_version(session)
+    if not snapshot or snapshot[0] < version:
+        snapshot = (version, _build_info(session))
+    return _store_info(snapshot)
+
+
+def get_info_snapshot() -> tuple[int, schemas.Info]:
+    '''Get info with its taxonomy version.
+
+    Served from the worker snapshot. The taxonomy version is checked at most
+    once per INFO_CACHE_TTL seconds and the snapshot is rebuilt only when the
+    version has changed, so a write on any worker is picked up by the others
+    within INFO_CACHE_TTL.
+    '''
+    snapshot = cached_info_snapshot()
+    if snapshot is None:
+        with db.read_session() as session:
+            snapshot = _refresh_info(session)
+    return snapshot
+
+
+async def get_info_snapshot_async() -> tuple[int, schemas.Info]:
+    '''Get info with its taxonomy version through the async engine.'''
+    snapshot = cached_info_snapshot()
+    if snapshot is None:
+        async with db.async_read_session() as session:
+            snapshot = await session.run_sync(_refresh_info)
+    return snapshot
 
 
 def get_info() -> schemas.Info:
     '''Get info.'''
+    return get_info_snapshot()[1]
 
-    with db.SessionLocal() as session:
-        users = session.query(models.User).order_by(models.User.weight).all()
-        term_materials = session.query(models.TermMaterial).order_by(models.TermMaterial.weight.desc()).all()
-        term_pages = session.query(models.TermPage).order_by(models.TermPage.weight.desc()).all()
-        mediums = session.query(models.Medium).order_by(models.Medium.weight.desc()).all()
-        campaign_projects = session.query(models.CampaignProject).order_by(models.CampaignProject.weight.desc()).all()
-        contents = session.query(models.Content).order_by(models.Content.weight.desc()).all()
-
-        return schemas.Info(
-            users=[
-                schemas.User(
-                    ident=user.id,
-                    value=user.name,
-                    is_bot=user.is_bot,
-                )
-                for user in users
-            ],
-            term_materials=[
-                schemas.BaseOption(
-                    ident=term_material.id,
-                    value=term_material.name,
-                )
-                for term_material in term_materials
-            ],
-            term_pages=[
-                schemas.BaseOption(
-                    ident=term_page.id,
-                    value=term_page.name,
-                )
-                for term_page in term_pages
-            ],
-            mediums=[
-                schemas.Medium(
-                    ident=medium.id,
-                    value=medium.name,
-                    sources=[
-                        schemas.BaseOption(
-                            ident=source.id,
-                            value=source.name,
-                        )
-                        for source in sorted(medium.sources, key=lambda x: x.weight, reverse=True)
-                    ],
-                )
-                for medium in mediums
-            ],
-            campaign_projects=[
-                schemas.BaseOption(
-                    ident=campaign_project.id,
-                    value=campaign_project.name,
-                )
-                for campaign_project in campaign_projects
-            ],
-            contents=[
-                schemas.BaseOption(
-                    ident=content.id,
-                    value=content.name,
+
+async def get_info_async() -> schemas.Info:
+    '''Get info through the async engine.'''
+    return (await get_info_snapshot_async())[1]
+
+
+def _rename_options(session: Session, model: type[models.Base], options: list[schemas.BaseOption]) -> set[int]:
+    '''Rename options that have an ident. Return the idents that exist.
+
+    Names copied to links are updated too, with one more statement if any
+    name has actually changed.
+    '''
+    renamed = {option.ident: option.value for option in options if option.ident is not None}
+    if not renamed:
+        return set()
+    # The self join sees the names from before the update.
+    table = model.__table__
+    old = table.alias('old')
+    existing = set()
+    changed = []
+    try:
+        for batch in _batched(list(renamed.items()), 2):
+            rows = values(column('id', Integer), column('name', String), name='renamed').data(batch)
+            result = session.execute(
+                update(table).where(table.c.id == rows.c.id, old.c.id == table.c.id).values(name=rows.c.name).returning(
+                    table.c.id, old.c.name != rows.c.name,
                 )
-                for content in contents
-            ],
-        )
+            )
+            for option_id, name_changed in result:
+                existing.add(option_id)
+                if name_changed:
+                    changed.append(option_id)
+    except IntegrityError:
+        session.rollback()
+        raise _rename_conflict(session, model, renamed)
+    if changed:
+        dimension = DIMENSION_BY_MODEL[model]
+        link_option_id = getattr(models.Link, f'{dimension}_id')
+        for batch in _batched(changed, 1):
+            session.execute(
+                update(models.Link).where(link_option_id == model.id, model.id.in_(batch)).values(
+                    {f'{dimension}_name': model.name}
+                ),
+                execution_options={'synchronize_session': False},
+            )
+    return existing
+
+
+def _rename_conflict(session: Session, model: type[models.Base], renamed: dict[int, str]) -> ValueError:
+    '''Error naming a value that renamed options cannot take, as it is or would be used twice.'''
+    dimension = DIMENSION_BY_MODEL[model]
+    for batch in _batched(list(set(renamed.values())), 1):
+        for name, option_id in session.execute(select(model.name, model.id).where(model.name.in_(batch))):
+            if option_id not in renamed:
+                return ValueError(f'{dimension} {name!r} is already the name of {dimension} {option_id}')
+    counts = Counter(renamed.values())
+    name = next((name for name, count in counts.items() if count > 1), None)
+    if name is not None:
+        return ValueError(f'{dimension} {name!r} is given to more than one {dimension}')
+    return ValueError(f'{dimension} options cannot swap names in one update')
 
 
-def update_info(data: schemas.Info):
+def _insert_options(session: Session, model: type[models.Base], rows: list[dict]) -> int:
+    '''Insert options, skipping names that already exist. Return how many were inserted.'''
+    if not rows:
+        return 0
+    return sum(
+        session.execute(pg_insert(model).values(batch).on_conflict_do_nothing(index_elements=['name'])).rowcount
+        # Column defaults are bound per row as well.
+        for batch in _batched(rows, len(model.__table__.columns))
+    )
+
+
+def _option_ids_by_name(session: Session, model: type[models.Base], names: Iterable[str]) -> dict[str, int]:
+    '''Get option ids by name.'''
+    ids = {}
+    for batch in _batched(list(set(names)), 1):
+        ids.update(session.execute(select(model.name, model.id).where(model.name.in_(batch))).tuples().all())
+    return ids
+
+
+def _insert_medium_sources(session: Session, pairs: Iterable[tuple[int, int]]) -> int:
+    '''Insert (medium id, source id) pairs, skipping existing ones. Return how many were inserted.'''
+    rows = [{'medium_id': medium_id, 'source_id': source_id} for medium_id, source_id in pairs]
+    return sum(
+        session.execute(
+            pg_insert(models.medium_source).values(batch)
+            .on_conflict_do_nothing(index_elements=['medium_id', 'source_id'])
+        ).rowcount
+        for batch in _batched(rows, 2)
+    )
+
+
+def add_options(
+    session: Session, names: Mapping[str, Iterable[str]], pairs: Iterable[tuple[str, str]] = ()
+) -> dict[str, dict[str, int]]:
+    '''Add options and (medium, source) pairs by name, skipping existing ones.
+
+    The taxonomy version is bumped if anything was added; the caller commits.
+    Return option ids by name per dimension, pair names included.
+    '''
+    pairs = set(pairs)
+    names = {dimension: set(dimension_names) for dimension, dimension_names in names.items()}
+    if pairs:
+        names.setdefault('medium', set()).update(medium for medium, _ in pairs)
+        names.setdefault('source', set()).update(source for _, source in pairs)
+    added = 0
+    ids = {}
+    for dimension, dimension_names in names.items():
+        model = LINK_DIMENSIONS[dimension]
+        added += _insert_options(session, model, [{'name': name} for name in dimension_names])
+        ids[dimension] = _option_ids_by_name(session, model, dimension_names)
+    added += _insert_medium_sources(session, {
+        (ids['medium'][medium], ids['source'][source]) for medium, source in pairs
+    })
+    if added:
+        _bump_taxonomy_version(session)
+    return ids
+
+
+def _upsert_options(session: Session, model: type[models.Base], options: list[schemas.BaseOption]):
+    '''Rename options that have an ident and add the new ones.'''
+    _rename_options(session, model, options)
+    _insert_options(session, model, [{'name': option.value} for option in options if option.ident is None])
+
+
+def _update_info(session: Session, data: schemas.Info) -> int:
+    '''Update info. Return the new taxonomy version.
+
+    Every option list is applied with a constant number of set-based
+    statements in a single transaction.
+    '''
+    _rename_options(session, models.User, data.users)
+    _insert_options(session, models.User, [
+        {'name': user.value, 'is_bot': user.is_bot} for user in data.users if user.ident is None
+    ])
+    _upsert_options(session, models.TermMaterial, data.term_materials)
+    _upsert_options(session, models.TermPage, data.term_pages)
+    _upsert_options(session, models.CampaignProject, data.campaign_projects)
+    _upsert_options(session, models.Content, data.contents)
+
+    # Mediums with an unknown ident are added by name.
+    medium_ids = _rename_options(session, models.Medium, data.mediums)
+    new_mediums = [medium.value for medium in data.mediums if medium.ident not in medium_ids]
+    _insert_options(session, models.Medium, [{'name': name} for name in new_mediums])
+    medium_ids_by_name = _option_ids_by_name(session, models.Medium, new_mediums)
+
+    # Sources are never renamed here; unknown ones are added by name.
+    sources = [source for medium in data.mediums for source in medium.sources]
+    source_idents = {source.ident for source in sources if source.ident is not None}
+    source_ids = set()
+    for batch in _batched(list(source_idents), 1):
+        source_ids.update(session.scalars(select(models.Source.id).where(models.Source.id.in_(batch))))
+    new_sources = [source.value for source in sources if source.ident not in source_ids]
+    _insert_options(session, models.Source, [{'name': name} for name in new_sources])
+    source_ids_by_name = _option_ids_by_name(session, models.Source, new_sources)
+
+    pairs = set()
+    for medium in data.mediums:
+        medium_id = medium.ident if medium.ident in medium_ids else medium_ids_by_name[medium.value]
+        for source in medium.sources:
+            source_id = source.ident if source.ident in source_ids else source_ids_by_name[source.value]
+            pairs.add((medium_id, source_id))
+    _insert_medium_sources(session, pairs)
+
+    version = _bump_taxonomy_version(session)
+    session.commit()
+    return version
+
+
+def _update_info_snapshot(session: Session, data: schemas.Info) -> tuple[int, schemas.Info]:
+    '''Update info and keep the snapshot of the version just committed.'''
+    version = _update_info(session, data)
+    return _store_info((version, _build_info(session)))
+
+
+def update_info(data: schemas.Info) -> schemas.Info:
     '''Update info.'''
     with db.SessionLocal() as session:
-        for user in data.users:
-            if user.ident is None:
-                session.query(models.User).filter(models.User.name == user.value).first() or session.add(models.User(name=user.value, is_bot=user.is_bot))
-            else:
-                session.query(models.User).filter(models.User.id == user.ident).update({'name': user.value})
-
-        for term_material in data.term_materials:
-            if term_material.ident is None:
-                session.query(models.TermMaterial).filter(models.TermMaterial.name == term_material.value).first() or session.add(models.TermMaterial(name=term_material.value))
-            else:
-                session.query(models.TermMaterial).filter(models.TermMaterial.id == term_material.ident).update({'name': term_material.value})
-
-        for term_page in data.term_pages:
-            if term_page.ident is None:
-                session.query(models.TermPage).filter(models.TermPage.name == term_page.value).first() or session.add(models.TermPage(name=term_page.value))
-            else:
-                session.query(models.TermPage).filter(models.TermPage.id == term_page.ident).update({'name': term_page.value})
-
-        for medium in data.mediums:
-            if medium.ident is None:
-                db_medium = session.query(models.Medium).filter(models.Medium.name == medium.value).first()
-                if not db_medium:
-                    db_medium = models.Medium(name=medium.value)
-                    session.add(db_medium)
-                    session.commit()
-            else:
-                db_medium = session.query(models.Medium).filter(models.Medium.id == medium.ident).first()
-                if not db_medium:
-                    db_medium = models.Medium(name=medium.value)
-                    session.add(db_medium)
-                    session.commit()
-                else:
-                    db_medium.name = medium.value
-                    session.commit()
-            for source in medium.sources:
-                if source.ident is None:
-                    db_source = session.query(models.Source).filter_by(name=source.value).first()
-                    if db_source and db_source in db_medium.sources:
-                        continue
-                    elif db_source:
-                        db_medium.sources.append(db_source)
-                    else:
-                        db_source = models.Source(name=source.value)
-                        db_medium.sources.append(db_source)
-                else:
-                    db_source = session.query(models.Source).filter_by(id=source.ident).first()
-                    if db_source and db_source in db_medium.sources:
-                        continue
-                    elif db_source:
-                        db_medium.sources.append(db_source)
-                    else:
-                        db_source = models.Source(name=source.value)
-                        db_medium.sources.append(db_source)
-            session.commit()
-
-        for campaign_project in data.campaign_projects:
-            if campaign_project.ident is None:
-                session.query(models.CampaignProject).filter(models.CampaignProject.name == campaign_project.value).first() or session.add(models.CampaignProject(name=campaign_project.value))
-            else:
-                session.query(models.CampaignProject).filter(models.CampaignProject.id == campaign_project.ident).update({'name': campaign_project.value})
-
-        for content in data.contents:
-            if content.ident is None:
-                session.query(models.Content).filter(models.Content.name == content.value).first() or session.add(models.Content(name=content.value))
-            else:
-                session.query(models.Content).filter(models.Content.id == content.ident).update({'name': content.value})
+        return _update_info_snapshot(session, data)[1]
 
-        session.commit()
 
+async def update_info_async(data: schemas.Info) -> schemas.Info:
+    '''Update info through the async engine.'''
+    async with db.AsyncSessionLocal() as session:
+        return (await session.run_sync(_update_info_snapshot, data))[1]
 
-def _make_utm_url(
-    target_url: str,
-    campaign_date: datetime,
-    term_material: str,
-    term_page: str,
-    medium: str,
-    source: str,
-    campaign_project: str,
-    content: str,
-    campaning_dop: str,
-    sendy_id: str
-) -> tuple[str, str]:
-    '''Make utm url. Return tuple (target_url, utm_url).'''
+
+def _utm_url_template(target_url: str) -> tuple[str, str]:
+    '''Make a str.format template of the utm url of a target url.
+
+    The target query is parsed and encoded once; the template has
+    `{utm_source}`, `{utm_medium}`, `{utm_campaign}`, `{utm_content}` and
+    `{utm_term}` fields that take already quoted values.
+    Return tuple (target_url, template).
+    '''
     url_parts = urlparse(target_url)
     query = parse_qs(url_parts.query)
-    query.update({
-        'utm_source': [source],
-        'utm_medium': [medium],
-        'utm_campaign': [f'{campaign_project}-{campaign_date.strftime("%Y%m%d")}-{sendy_id}'],
-        'utm_content': [content],
-        'utm_term': [f'{term_material}-{term_page}-{campaning_dop}'],
-    })
-    utm_url_parts = url_parts._replace(query=urlencode(query, doseq=True))
-    utm_url = utm_url_parts.geturl()
+    query.update(dict.fromkeys(UTM_KEYS))
+    fields = '&'.join(
+        f'{key}={{{key}}}' if key in UTM_KEYS else urlencode({key: value}, doseq=True)
+        for key, value in query.items()
+    )
+    prefix, suffix = (
+        part.replace('{', '{{').replace('}', '}}')
+        for part in url_parts._replace(query='\0').geturl().split('\0')
+    )
+    return url_parts.geturl(), prefix + fields + suffix
+
+
+# Quoted option names and utm url templates of recent target urls.
+_quote = lru_cache(maxsize=QUOTE_CACHE_SIZE)(quote_plus)
+_cached_utm_url_template = lru_cache(maxsize=TEMPLATE_CACHE_SIZE)(_utm_url_template)
+
+
+def make_full_url(
+    target_url: str, campaign_date: datetime, names: Mapping[str, str], campaign_dop: str, sendy_id: int | str
+) -> tuple[str, str]:
+    '''Make the utm url of a link from the names of its PREVIEW_DIMENSIONS.
+
+    The only place the utm url is built, for created, previewed and imported
+    links alike. Return tuple (target_url, full_url).
+    '''
+    target_url, template = _cached_utm_url_template(target_url)
+    sendy_id = str(sendy_id) if sendy_id else '0'
+    return target_url, template.format(
+        utm_source=_quote(names['source']),
+        utm_medium=_quote(names['medium']),
+        utm_campaign=f'{_quote(names["campaign_project"])}-{campaign_date:%Y%m%d}-{_quote(sendy_id)}',
+        utm_content=_quote(names['content']),
+        utm_term=f'{_quote(names["term_material"])}-{_quote(names["term_page"])}-{_quote(campaign_dop)}',
+    )
+
+
+def _option_filter(model: type[models.Base], refs: Iterable[int | str]) -> ColumnElement[bool]:
+    '''Match dimension rows referenced by id or by name.'''
+    ids = [ref for ref in refs if isinstance(ref, int)]
+    names = [ref for ref in refs if isinstance(ref, str)]
+    return or_(model.id.in_(ids), model.name.in_(names))
+
+
+def _option_fields(options: dict[str, Row]) -> dict[str, int | str]:
+    '''Map resolved dimensions to `<dimension>_id` and `<dimension>_name` fields.'''
+    fields = {}
+    for dimension, option in options.items():
+        fields[f'{dimension}_id'] = option.id
+        fields[f'{dimension}_name'] = option.name
+    return fields
+
+
+def _resolve_link_options(session: Session, data: schemas.LinkCreate) -> dict[str, Row]:
+    '''Resolve every dimension of a link in one query.
+
+    The source row also reports whether it is linked to the requested medium.
+    '''
+    medium_id = select(models.Medium.id).where(
+        _option_filter(models.Medium, [data.medium])
+    ).limit(1).scalar_subquery()
+    queries = []
+    for dimension, model in LINK_DIMENSIONS.items():
+        if model is models.Source:
+            allowed = exists().where(
+                models.medium_source.c.medium_id == medium_id,
+                models.medium_source.c.source_id == models.Source.id,
+            )
+        else:
+            allowed = literal(True)
+        queries.append(
+            select(
+                literal(dimension).label('dimension'),
+                model.id,
+                model.name,
+                allowed.label('allowed'),
+            ).where(_option_filter(model, [getattr(data, dimension)]))
+        )
+
+    options = {}
+    for row in session.execute(union_all(*queries)):
+        if row.dimension not in options or row.allowed and not options[row.dimension].allowed:
+            options[row.dimension] = row
 
-    return url_parts.geturl(), utm_url
+    for dimension, model in LINK_DIMENSIONS.items():
+        if dimension not in options:
+            raise ValueError(f'{model.__name__} not found: {getattr(data, dimension)!r}')
+    if not options['source'].allowed:
+        raise _source_not_allowed(options)
+    return options
 
 
-def create_link(data: schemas.LinkCreate) -> schemas.Link:
+def _source_not_allowed(options: dict[str, Row]) -> ValueError:
+    '''Error for a source that is not linked to the medium.'''
+    return ValueError(
+        f'Source {options["source"].name!r} is not available for Medium {options["medium"].name!r}'
+    )
+
+
+def _resolve_options(
+    session: Session, refs: dict[str, Iterable[int | str]]
+) -> tuple[dict[str, dict[int | str, Row]], set[tuple[int, int]]]:
+    '''Resolve dimension references given by id or name.
+
+    Return lookups by id and by name for each dimension and the medium/source
+    pairs that are allowed among the resolved ones. Two queries in total.
+    '''
+    queries = [
+        select(
+            literal(dimension).label('dimension'),
+            LINK_DIMENSIONS[dimension].id,
+            LINK_DIMENSIONS[dimension].name,
+        ).where(_option_filter(LINK_DIMENSIONS[dimension], set(dimension_refs)))
+        for dimension, dimension_refs in refs.items()
+    ]
+    lookups: dict[str, dict[int | str, Row]] = {dimension: {} for dimension in LINK_DIMENSIONS}
+    for row in session.execute(union_all(*queries)):
+        lookups[row.dimension].setdefault(row.id, row)
+        lookups[row.dimension].setdefault(row.name, row)
+
+    medium_ids = {row.id for row in lookups['medium'].values()}
+    source_ids = {row.id for row in lookups['source'].values()}
+    pairs = set()
+    if medium_ids and source_ids:
+        pairs = set(session.execute(
+            select(models.medium_source.c.medium_id, models.medium_source.c.source_id).where(
+                models.medium_source.c.medium_id.in_(medium_ids),
+                models.medium_source.c.source_id.in_(source_ids),
+            )
+        ).tuples())
+    return lookups, pairs
+
+
+def _insert_links(session: Session, rows: list[dict]) -> list[Row]:
+    '''Insert links with fresh short codes in one statement.
+
+    Return (id, short_code) rows in the order of `rows`. A short code
+    collision fails the transaction; see _retry_short_codes.
+    '''
+    for row in rows:
+        row['short_code'] = models.new_short_code(row['campaign_date'])
+    return session.execute(
+        insert(models.Link).returning(models.Link.id, models.Link.short_code, sort_by_parameter_order=True),
+        rows,
+    ).all()
+
+
+def _retry_short_codes(session: Session, create: Callable[..., T], *args) -> T:
+    '''Run a transaction inserting links, again from the start if a short code collides.
+
+    Collisions are rare enough that redoing the transaction is cheaper than
+    a savepoint around every insert.
+    '''
+    for attempt in range(SHORT_CODE_ATTEMPTS):
+        try:
+            return create(session, *args)
+        except IntegrityError:
+            session.rollback()
+            if attempt == SHORT_CODE_ATTEMPTS - 1:
+                raise
+
+
+def _create_link(session: Session, data: schemas.LinkCreate, idempotency_key: str | None = None) -> schemas.Link:
+    '''Create link.
+
+    With an idempotency key, the link created with that key is returned
+    instead, without resolving or inserting anything.
+    '''
+    if idempotency_key is not None:
+        stored = idempotency.stored_link(session, idempotency_key, data)
+        if stored is not None:
+            return stored
+
+    campaign_date = datetime.now()
+    options = _resolve_link_options(session, data)
+
+    target_url, full_url = make_full_url(
+        data.target_url,
+        campaign_date,
+        {dimension: options[dimension].name for dimension in PREVIEW_DIMENSIONS},
+        data.campaning_dop,
+        data.sendy_id,
+    )
+    campaign_dop = data.campaning_dop or '0'
+    [link] = _insert_links(session, [{
+        'target_url': target_url,
+        'full_url': full_url,
+        'campaign_date': campaign_date,
+        'campaign_dop': campaign_dop,
+        **{f'{dimension}_id': option.id for dimension, option in options.items()},
+        **{f'{dimension}_name': option.name for dimension, option in options.items()},
+    }])
+    created = schemas.Link(
+        id=link.id,
+        target_url=target_url,
+        campaign_date=campaign_date,
+        campaign_dop=campaign_dop,
+        full_url=full_url,
+        short_code=link.short_code,
+        **_option_fields(options),
+    )
+    if idempotency_key is not None and not idempotency.store(session, idempotency_key, data, created):
+        # A concurrent request with the same key committed first.
+        session.rollback()
+        return _create_link(session, data, idempotency_key)
+    session.commit()
+    usage.record({LINK_DIMENSIONS[dimension]: option.id for dimension, option in options.items()})
+    bitly.enqueue([(created.id, campaign_date, full_url)])
+    if idempotency_key is not None:
+        idempotency.remember(idempotency_key, data, created)
+    return created
+
+
+def create_link(data: schemas.LinkCreate, idempotency_key: str | None = None) -> schemas.Link:
     '''Create link.'''
     with db.SessionLocal() as session:
-        campaign_date = datetime.now()
-        if isinstance(data.term_material, int):
-            db_term_material = session.query(models.TermMaterial).filter_by(id=data.term_material).first()
-        elif isinstance(data.term_material, str):
-            db_term_material = session.query(models.TermMaterial).filter_by(name=data.term_material).first()
-        if not db_term_material:
-            raise ValueError('TermMaterial not found')
-        if isinstance(data.term_page, int):
-            db_term_page = session.query(models.TermPage).filter_by(id=data.term_page).first()
-        elif isinstance(data.term_page, str):
-            db_term_page = session.query(models.TermPage).filter_by(name=data.term_page).first()
-        if not db_term_page:
-            raise ValueError('TermPage not found')
-        if isinstance(data.medium, int):
-            db_medium = session.query(models.Medium).filter_by(id=data.medium).first()
-        elif isinstance(data.medium, str):
-            db_medium = session.query(models.Medium).filter_by(name=data.medium).first()
-        if not db_medium:
-            raise ValueError('Medium not found')
-        if isinstance(data.source, int):
-            db_source = session.query(models.Source).filter_by(id=data.source).first()
-        elif isinstance(data.source, str):
-            db_source = session.query(models.Source).filter_by(name=data.source).first()
-        if not db_source or db_source not in db_medium.sources:
-            raise ValueError('Source not found')
-        if isinstance(data.campaign_project, int):
-            db_campaign_project = session.query(models.CampaignProject).filter_by(id=data.campaign_project).first()
-        elif isinstance(data.campaign_project, str):
-            db_campaign_project = session.query(models.CampaignProject).filter_by(name=data.campaign_project).first()
-        if not db_campaign_project:
-            raise ValueError('CampaignProject not found')
-
-        if isinstance(data.content, int):
-            db_content = session.query(models.Content).filter_by(id=data.content).first()
-        elif isinstance(data.content, str):
-            db_content = session.query(models.Content).filter_by(name=data.content).first()
-        if not db_content:
-            raise ValueError('Content not found')
-        if isinstance(data.user, int):
-            db_user = session.query(models.User).filter_by(id=data.user).first()
-        elif isinstance(data.user, str):
-            db_user = session.query(models.User).filter_by(name=data.user).first()
-        if not db_user:
-            raise ValueError('User not found')
-
-        target_url, full_url = _make_utm_url(
+        return _retry_short_codes(session, _create_link, data, idempotency_key)
+
+
+async def create_link_async(data: schemas.LinkCreate, idempotency_key: str | None = None) -> schemas.Link:
+    '''Create link through the async engine.'''
+    async with db.AsyncSessionLocal() as session:
+        return await session.run_sync(_retry_short_codes, _create_link, data, idempotency_key)
+
+
+def _create_links(session: Session, batch: list[schemas.LinkCreate]) -> schemas.CreatedLinks:
+    '''Create links in bulk.
+
+    Links come back in request order; items that could not be created are
+    None in `links` and reported in `errors`.
+    '''
+    links: list[schemas.Link | None] = [None] * len(batch)
+    errors = []
+    campaign_date = datetime.now()
+    lookups, pairs = _resolve_options(session, {
+        dimension: [getattr(data, dimension) for data in batch] for dimension in LINK_DIMENSIONS
+    })
+
+    created = []
+    for index, data in enumerate(batch):
+        try:
+            options = {}
+            for dimension, model in LINK_DIMENSIONS.items():
+                ref = getattr(data, dimension)
+                option = lookups[dimension].get(ref)
+                if option is None:
+                    raise ValueError(f'{model.__name__} not found: {ref!r}')
+                options[dimension] = option
+            if (options['medium'].id, options['source'].id) not in pairs:
+                raise _source_not_allowed(options)
+        except ValueError as err:
+            errors.append(schemas.LinkError(index=index, detail=str(err)))
+            continue
+
+        target_url, full_url = make_full_url(
             data.target_url,
             campaign_date,
-            db_term_material.name,
-            db_term_page.name,
-            db_medium.name,
-            db_source.name,
-            db_campaign_project.name,
-            db_content.name,
+            {dimension: options[dimension].name for dimension in PREVIEW_DIMENSIONS},
             data.campaning_dop,
-            str(data.sendy_id) if data.sendy_id else '0',
-        )
-        db_link = models.Link(
-            target_url=target_url,
-            full_url=full_url,
-            campaign_date=campaign_date,
-            term_material=db_term_material,
-            term_page=db_term_page,
-            medium=db_medium,
-            source=db_source,
-            campaign_project=db_campaign_project,
-            content=db_content,
-            user=db_user,
+            data.sendy_id,
         )
-        if data.campaning_dop:
-            db_link.campaign_dop = data.campaning_dop
+        created.append((index, options, {
+            'target_url': target_url,
+            'full_url': full_url,
+            'campaign_date': campaign_date,
+            'campaign_dop': data.campaning_dop or '0',
+            **{f'{dimension}_id': option.id for dimension, option in options.items()},
+            **{f'{dimension}_name': option.name for dimension, option in options.items()},
+        }))
 
-        session.add(db_link)
+    if created:
+        inserted = _insert_links(session, [link_values for _, _, link_values in created])
         session.commit()
-        return schemas.Link(
-            id=db_link.id,
-            target_url=db_link.target_url,
-            campaign_date=db_link.campaign_date,
-            campaign_dop=db_link.campaign_dop,
-            full_url=db_link.full_url,
-            term_material_id=db_link.term_material_id,
-            term_material_name=db_link.term_material.name,
-            term_page_id=db_link.term_page_id,
-            term_page_name=db_link.term_page.name,
-            medium_id=db_link.medium_id,
-            medium_name=db_link.medium.name,
-            source_id=db_link.source_id,
-            source_name=db_link.source.name,
-            campaign_project_id=db_link.campaign_project_id,
-            campaign_project_name=db_link.campaign_project.name,
-            content_id=db_link.content_id,
-            content_name=db_link.content.name,
-            user_id=db_link.user_id,
-            user_name=db_link.user.name,
+        bitly.enqueue([
+            (link.id, campaign_date, link_values['full_url']) for link, (_, _, link_values) in zip(inserted, created)
+        ])
+        for link, (index, options, link_values) in zip(inserted, created):
+            usage.record({LINK_DIMENSIONS[dimension]: option.id for dimension, option in options.items()})
+            links[index] = schemas.Link(
+                id=link.id,
+                target_url=link_values['target_url'],
+                campaign_date=campaign_date,
+                campaign_dop=link_values['campaign_dop'],
+                full_url=link_values['full_url'],
+                short_code=link.short_code,
+                **_option_fields(options),
+            )
+
+    return schemas.CreatedLinks(links=links, errors=errors)
+
+
+def create_links(batch: list[schemas.LinkCreate]) -> schemas.CreatedLinks:
+    '''Create links in bulk.'''
+    with db.SessionLocal() as session:
+        return _retry_short_codes(session, _create_links, batch)
+
+
+async def create_links_async(batch: list[schemas.LinkCreate]) -> schemas.CreatedLinks:
+    '''Create links in bulk through the async engine.'''
+    async with db.AsyncSessionLocal() as session:
+        return await session.run_sync(_retry_short_codes, _create_links, batch)
+
+
+class LinkPage(NamedTuple):
+    '''Page of links, serialized like schemas.LastLinks.'''
+
+    links: list[dict]
+    next_cursor: str | None
+
+
+def _link_select() -> Select:
+    '''Select links shaped like schemas.Link, from the link table alone.'''
+    columns = [
+        models.Link.id,
+        models.Link.target_url,
+        models.Link.campaign_date,
+        models.Link.campaign_dop,
+        models.Link.full_url,
+        models.Link.short_code,
+        models.Link.short_url,
+    ]
+    for dimension in LINK_DIMENSIONS:
+        columns += [getattr(models.Link, f'{dimension}_id'), getattr(models.Link, f'{dimension}_name')]
+    return select(*columns)
+
+
+def _encode_cursor(campaign_date: datetime, link_id: int) -> str:
+    '''Encode the position after a link as an opaque cursor.'''
+    return urlsafe_b64encode(f'{campaign_date.isoformat()}|{link_id}'.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    '''Decode a cursor made by _encode_cursor.'''
+    try:
+        campaign_date, link_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(campaign_date), int(link_id)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+
+def _link_page(session: Session, statement: Select, num: int, cursor: str | None) -> LinkPage:
+    '''Page of `num` links of a _link_select() statement, newest first.
+
+    Keyset pagination over (campaign_date, id): `cursor` is the
+    `next_cursor` of the previous page. The rows already have the shape of
+    schemas.Link, so they are kept as dicts instead of being validated into
+    models.
+    '''
+    if cursor:
+        campaign_date, link_id = _decode_cursor(cursor)
+        # The plain bound lets the planner skip newer partitions.
+        statement = statement.where(
+            models.Link.campaign_date <= campaign_date,
+            tuple_(models.Link.campaign_date, models.Link.id) < (campaign_date, link_id),
         )
+    rows = session.execute(
+        statement.order_by(models.Link.campaign_date.desc(), models.Link.id.desc()).limit(num)
+    ).all()
+    next_cursor = None
+    if len(rows) == num:
+        next_cursor = _encode_cursor(rows[-1].campaign_date, rows[-1].id)
+    return LinkPage(links=[dict(row._mapping) for row in rows], next_cursor=next_cursor)
 
 
-def get_last_links(num: int = 10) -> schemas.LastLinks:
+def _get_last_links(session: Session, num: int = 10, cursor: str | None = None) -> LinkPage:
+    '''Get last links of non-bot users, newest first, in keyset pages.'''
+    statement = _link_select().where(
+        models.Link.user_id.not_in(select(models.User.id).where(models.User.is_bot.is_(True)))
+    )
+    return _link_page(session, statement, num, cursor)
+
+
+def get_last_links(num: int = 10, cursor: str | None = None) -> LinkPage:
     '''Get last links.'''
-    with db.SessionLocal() as session:
-        users = session.query(models.User).filter(models.User.is_bot == False).all()
-        links = session.query(models.Link).filter(models.Link.user_id.in_([user.id for user in users])).order_by(models.Link.campaign_date.desc()).limit(num).all()
-        return schemas.LastLinks(
-            links=[
-                schemas.Link(
-                    id=link.id,
-                    target_url=link.target_url,
-                    campaign_date=link.campaign_date,
-                    campaign_dop=link.campaign_dop,
-                    full_url=link.full_url,
-                    term_material_id=link.term_material_id,
-                    term_material_name=link.term_material.name,
-                    term_page_id=link.term_page_id,
-                    term_page_name=link.term_page.name,
-                    medium_id=link.medium_id,
-                    medium_name=link.medium.name,
-                    source_id=link.source_id,
-                    source_name=link.source.name,
-                    campaign_project_id=link.campaign_project_id,
-                    campaign_project_name=link.campaign_project.name,
-                    content_id=link.content_id,
-                    content_name=link.content.name,
-                    user_id=link.user_id,
-                    user_name=link.user.name,
-                )
-                for link in links
-            ]
-        )
\ No newline at end of file
+    with db.read_session() as session:
+        return _get_last_links(session, num, cursor)
+
+
+async def get_last_links_async(num: int = 10, cursor: str | None = None) -> LinkPage:
+    '''Get last links through the async engine.'''
+    async with db.async_read_session() as session:
+        return await session.run_sync(_get_last_links, num, cursor)
+
+
+def _escape_like(value: str) -> str:
+    '''Escape LIKE wildcards so value matches literally.'''
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _get_links(
+    session: Session, filters: schemas.LinkFilter, num: int = 10, cursor: str | None = None
+) -> LinkPage:
+    '''Get links matching filters, newest first, in keyset pages like get_last_links.
+
+    Filters without an index of their own (content_id) need an indexed one
+    next to them, so a query never scans the whole table.
+    '''
+    given = filters.model_dump(exclude_none=True)
+    if given and not any(name in given for name in INDEXED_LINK_FILTERS):
+        raise ValueError(f'Filter by {", ".join(given)} needs one of {", ".join(INDEXED_LINK_FILTERS)}')
+
+    statement = _link_select()
+    for dimension in LINK_DIMENSIONS:
+        option_id = given.get(f'{dimension}_id')
+        if option_id is not None:
+            statement = statement.where(getattr(models.Link, f'{dimension}_id') == option_id)
+    if filters.date_from:
+        statement = statement.where(models.Link.campaign_date >= filters.date_from)
+    if filters.date_to:
+        statement = statement.where(models.Link.campaign_date < filters.date_to)
+    if filters.target_url_prefix:
+        statement = statement.where(models.Link.target_url.like(_escape_like(filters.target_url_prefix) + '%'))
+    return _link_page(session, statement, num, cursor)
+
+
+def get_links(filters: schemas.LinkFilter, num: int = 10, cursor: str | None = None) -> LinkPage:
+    '''Get links.'''
+    with db.read_session() as session:
+        return _get_links(session, filters, num, cursor)
+
+
+async def get_links_async(filters: schemas.LinkFilter, num: int = 10, cursor: str | None = None) -> LinkPage:
+    '''Get links through the async engine.'''
+    async with db.async_read_session() as session:
+        return await session.run_sync(_get_links, filters, num, cursor)
+
+
+def iter_link_batches(since: datetime | None = None) -> Iterator[list[RowMapping]]:
+    '''Stream links with their dimension names in batches of EXPORT_BATCH_SIZE.
+
+    Rows come from a server-side cursor, so memory stays flat whatever the
+    size of the link table.
+    '''
+    statement = _link_select().order_by(models.Link.id)
+    if since:
+        statement = statement.where(models.Link.campaign_date >= since)
+    with db.read_session() as session:
+        result = session.execute(statement, execution_options={'yield_per': EXPORT_BATCH_SIZE})
+        for batch in result.mappings().partitions():
+            yield batch
+
+
+def _preview_links(session: Session, data: schemas.PreviewLinks) -> Iterator[list[dict]]:
+    '''Resolve the dimensions of a preview and return its url batches.
+
+    Dimensions are resolved eagerly so that unknown ones fail before anything
+    is streamed; urls are then generated lazily without touching the database.
+    '''
+    refs = {dimension: getattr(data, f'{dimension}s') for dimension in PREVIEW_DIMENSIONS}
+    lookups, pairs = _resolve_options(session, refs)
+    options = {}
+    for dimension, dimension_refs in refs.items():
+        options[dimension] = []
+        for ref in dict.fromkeys(dimension_refs):
+            if ref not in lookups[dimension]:
+                raise ValueError(f'{LINK_DIMENSIONS[dimension].__name__} not found: {ref!r}')
+            options[dimension].append(lookups[dimension][ref])
+    medium_sources = [
+        (medium, source)
+        for medium in options['medium']
+        for source in options['source']
+        if (medium.id, source.id) in pairs
+    ]
+    total = len(medium_sources)
+    for dimension in ('campaign_project', 'content', 'term_material', 'term_page'):
+        total *= len(options[dimension])
+    if total > PREVIEW_MAX_LINKS:
+        raise ValueError(f'Preview has {total} links, at most {PREVIEW_MAX_LINKS} are allowed')
+    return _iter_preview_links(data, options, medium_sources)
+
+
+def _iter_preview_links(
+    data: schemas.PreviewLinks, options: dict[str, list[Row]], medium_sources: list[tuple[Row, Row]]
+) -> Iterator[list[dict]]:
+    '''Generate preview links in batches of EXPORT_BATCH_SIZE.'''
+    campaign_date = datetime.now()
+    batch = []
+    for medium, source in medium_sources:
+        for campaign_project in options['campaign_project']:
+            for content in options['content']:
+                for term_material in options['term_material']:
+                    for term_page in options['term_page']:
+                        names = {
+                            'term_material': term_material.name,
+                            'term_page': term_page.name,
+                            'medium': medium.name,
+                            'source': source.name,
+                            'campaign_project': campaign_project.name,
+                            'content': content.name,
+                        }
+                        target_url, full_url = make_full_url(
+                            data.target_url, campaign_date, names, data.campaning_dop, data.sendy_id,
+                        )
+                        batch.append({
+                            'target_url': target_url,
+                            'full_url': full_url,
+                            'term_material_name': term_material.name,
+                            'term_page_name': term_page.name,
+                            'medium_name': medium.name,
+                            'source_name': source.name,
+                            'campaign_project_name': campaign_project.name,
+                            'content_name': content.name,
+                        })
+                        if len(batch) == EXPORT_BATCH_SIZE:
+                            yield batch
+                            batch = []
+    if batch:
+        yield batch
+
+
+def preview_links(data: schemas.PreviewLinks) -> Iterator[list[dict]]:
+    '''Preview every utm link of a target without creating them.'''
+    with db.read_session() as session:
+        return _preview_links(session, data)
+
+
+async def preview_links_async(data: schemas.PreviewLinks) -> Iterator[list[dict]]:
+    '''Preview every utm link of a target through the async engine.'''
+    async with db.async_read_session() as session:
+        return await session.run_sync(_preview_links, data)
+
+
+def cached_full_url(short_code: str) -> str | None:
+    '''Get the full url of a short code if this worker has it cached.'''
+    return _short_links.get(short_code)
+
+
+def _get_full_url(session: Session, short_code: str) -> str | None:
+    '''Get the full url of a short code and cache it.'''
+    statement = select(models.Link.full_url).where(models.Link.short_code == short_code)
+    month = models.short_code_month(short_code)
+    if month is not None:
+        # Only the partition of that month can hold the code.
+        statement = statement.where(
+            models.Link.campaign_date >= month, models.Link.campaign_date < partitions.add_months(month, 1)
+        )
+    full_url = session.scalar(statement)
+    if full_url is not None:
+        _short_links.put(short_code, full_url)
+    return full_url
+
+
+def get_full_url(short_code: str) -> str | None:
+    '''Get the full url of a short code.'''
+    full_url = cached_full_url(short_code)
+    if full_url is None:
+        with db.read_session() as session:
+            full_url = _get_full_url(session, short_code)
+            replica = session.info.get('replica', False)
+        if full_url is None and replica:
+            # The link may be younger than the replica lag.
+            with db.SessionLocal() as session:
+                full_url = _get_full_url(session, short_code)
+    return full_url
+
+
+async def get_full_url_async(short_code: str) -> str | None:
+    '''Get the full url of a short code through the async engine.'''
+    full_url = cached_full_url(short_code)
+    if full_url is None:
+        async with db.async_read_session() as session:
+            full_url = await session.run_sync(_get_full_url, short_code)
+            replica = session.info.get('replica', False)
+        if full_url is None and replica:
+            async with db.AsyncSessionLocal() as session:
+                full_url = await session.run_sync(_get_full_url, short_code)
+    return full_url
@@ -0,0 +1,107 @@
+'''Idempotency keys of create_link.
+
+A key remembers the hash of the request it was first used with and the link
+created then, for IDEMPOTENCY_KEY_TTL seconds. A retry with the same key gets
+that link back; the same key with another request is an error. The key row
+is written in the transaction inserting the link, so a concurrent retry
+waits for it and then finds the key used.
+'''
+from datetime import timedelta
+from hashlib import sha256
+from os import environ
+from time import time
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from link_dealer import db, models, schemas
+from link_dealer.cache import LRUCache
+
+IDEMPOTENCY_KEY_TTL = float(environ.get('IDEMPOTENCY_KEY_TTL', '86400'))
+IDEMPOTENCY_CACHE_SIZE = int(environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+IDEMPOTENCY_CLEANUP_INTERVAL = float(environ.get('IDEMPOTENCY_CLEANUP_INTERVAL', '600'))
+IDEMPOTENCY_CLEANUP_BATCH = int(environ.get('IDEMPOTENCY_CLEANUP_BATCH', '1000'))
+MAX_KEY_LENGTH = 255
+
+# key -> (request hash, link, expires at) of keys recently used on this worker.
+_recent: LRUCache[tuple[str, schemas.Link, float]] = LRUCache(IDEMPOTENCY_CACHE_SIZE)
+
+
+def request_hash(data: schemas.LinkCreate) -> str:
+    return sha256(data.model_dump_json().encode()).hexdigest()
+
+
+def _replay(key: str, stored_hash: str, link: schemas.Link, data: schemas.LinkCreate) -> schemas.Link:
+    if stored_hash != request_hash(data):
+        raise ValueError(f'Idempotency-Key {key!r} was already used with another request')
+    return link
+
+
+def _expired_before():
+    return func.now() - timedelta(seconds=IDEMPOTENCY_KEY_TTL)
+
+
+def remember(key: str, data: schemas.LinkCreate, link: schemas.Link):
+    '''Keep a used key on this worker.'''
+    _recent.put(key, (request_hash(data), link, time() + IDEMPOTENCY_KEY_TTL))
+
+
+def cached_link(key: str, data: schemas.LinkCreate) -> schemas.Link | None:
+    '''Get the link of a key if this worker has it cached.'''
+    entry = _recent.get(key)
+    if entry is None or entry[2] <= time():
+        return None
+    return _replay(key, entry[0], entry[1], data)
+
+
+def stored_link(session: Session, key: str, data: schemas.LinkCreate) -> schemas.Link | None:
+    '''Get the link of a key that has not expired.'''
+    row = session.execute(
+        select(models.IdempotencyKey.request_hash, models.IdempotencyKey.response).where(
+            models.IdempotencyKey.key == key, models.IdempotencyKey.created_at >= _expired_before(),
+        )
+    ).first()
+    if row is None:
+        return None
+    link = schemas.Link.model_validate_json(row.response)
+    _recent.put(key, (row.request_hash, link, time() + IDEMPOTENCY_KEY_TTL))
+    return _replay(key, row.request_hash, link, data)
+
+
+def store(session: Session, key: str, data: schemas.LinkCreate, link: schemas.Link) -> bool:
+    '''Record a key in the current transaction; an expired record is replaced.
+
+    Return False if the key is already used, possibly by a concurrent request
+    whose transaction this one has waited for.
+    '''
+    statement = pg_insert(models.IdempotencyKey).values(
+        key=key, request_hash=request_hash(data), response=link.model_dump_json(), created_at=func.now(),
+    )
+    stored = session.scalar(
+        statement.on_conflict_do_update(
+            index_elements=['key'],
+            set_={
+                'request_hash': statement.excluded.request_hash,
+                'response': statement.excluded.response,
+                'created_at': statement.excluded.created_at,
+            },
+            where=models.IdempotencyKey.created_at < _expired_before(),
+        ).returning(models.IdempotencyKey.key)
+    )
+    return stored is not None
+
+
+def cleanup():
+    '''Delete expired keys, IDEMPOTENCY_CLEANUP_BATCH per transaction.'''
+    while True:
+        with db.SessionLocal() as session:
+            expired = select(models.IdempotencyKey.key).where(
+                models.IdempotencyKey.created_at < _expired_before()
+            ).limit(IDEMPOTENCY_CLEANUP_BATCH).with_for_update(skip_locked=True)
+            deleted = session.execute(
+                delete(models.IdempotencyKey).where(models.IdempotencyKey.key.in_(expired.scalar_subquery()))
+            ).rowcount
+            session.commit()
+        if deleted < IDEMPOTENCY_CLEANUP_BATCH:
+            return
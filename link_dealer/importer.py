@@ -0,0 +1,282 @@
+'''Bulk import of links.
+
+    python -m link_dealer.importer links.csv --rejects rejects.csv
+    python -m link_dealer.importer links.ndjson --rejects rejects.ndjson --keep-full-url
+
+Input rows are CSV with a header or NDJSON objects with the fields of
+schemas.LinkImport. Dimensions are given by name; missing ones are created,
+together with their medium/source pair. full_url is built the way
+create_link builds it; a given full_url has to match unless --keep-full-url.
+A given short_code is kept and has to be unused, URL-safe and, if it reads
+as a month-prefixed code, of the campaign month; others are generated.
+
+Links are loaded with COPY in chunks of --chunk-size rows, each committed on
+its own, and progress is logged after each chunk. Rows that cannot be
+imported go to the rejects file, in the input format, with their `line` and
+the `error`.
+'''
+import argparse
+import csv
+import io
+import json
+import re
+import sys
+from datetime import date, datetime, time
+from os import environ
+from pathlib import Path
+from time import perf_counter
+from typing import IO, Iterator
+
+from loguru import logger
+from psycopg2.errors import UniqueViolation
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from link_dealer import db, db_tools, models, partitions, schemas
+
+IMPORT_CHUNK_SIZE = int(environ.get('IMPORT_CHUNK_SIZE', '10000'))
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+# Columns of link filled by COPY, in order.
+LINK_COLUMNS = [
+    'target_url', 'campaign_date', 'campaign_dop', 'full_url', 'short_code',
+    *(f'{dimension}_id' for dimension in db_tools.LINK_DIMENSIONS),
+    *(f'{dimension}_name' for dimension in db_tools.LINK_DIMENSIONS),
+]
+MAX_SHORT_CODE_LENGTH = 2 * models.SHORT_CODE_LENGTH
+# URL path characters that need no escaping; a leading dot could make '.' or '..'.
+SHORT_CODE_PATTERN = re.compile(r'[A-Za-z0-9_~-][A-Za-z0-9_.~-]*')
+
+
+def read_rows(file: IO[str], format: str) -> Iterator[tuple[int, dict, str | None]]:
+    '''Yield (line, row, error) for each input row; an unreadable line comes as {'raw': line}.'''
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for line, text in enumerate(file, 1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as err:
+            yield line, {'raw': text.rstrip('\n')}, f'Invalid JSON: {err}'
+            continue
+        if isinstance(row, dict):
+            yield line, row, None
+        else:
+            yield line, {'raw': text.rstrip('\n')}, 'Expected a JSON object'
+
+
+class Rejects:
+    '''Rejected rows with their line and error, in the input format.'''
+
+    def __init__(self, file: IO[str], format: str):
+        self.file = file
+        self.format = format
+        self.count = 0
+        self._writer: csv.DictWriter | None = None
+
+    def add(self, line: int, row: dict, error: str):
+        self.count += 1
+        row = {key: value for key, value in row.items() if isinstance(key, str)}
+        row.update(line=line, error=error)
+        if self.format == 'ndjson':
+            self.file.write(json.dumps(row, default=str) + '\n')
+            return
+        if self._writer is None:
+            self._writer = csv.DictWriter(self.file, fieldnames=list(row), extrasaction='ignore')
+            self._writer.writeheader()
+        self._writer.writerow(row)
+
+
+def _check_short_code(short_code: str, campaign_date: datetime):
+    '''Reject a given short code that /r/{code} could not resolve to its link.'''
+    if len(short_code) > MAX_SHORT_CODE_LENGTH:
+        raise ValueError(f'Short code is longer than {MAX_SHORT_CODE_LENGTH} characters')
+    if not SHORT_CODE_PATTERN.fullmatch(short_code):
+        raise ValueError(f'Short code {short_code!r} has characters that cannot appear in a redirect path')
+    # The redirect only looks for such a code in the partition of the month it encodes.
+    month = models.short_code_month(short_code)
+    if month is not None and month != campaign_date.date().replace(day=1):
+        raise ValueError(f'Short code {short_code!r} reads as a code of {month:%Y-%m}, not of the campaign month')
+
+
+def _parse(row: dict) -> schemas.LinkImport:
+    '''Validate an input row; empty CSV cells count as missing.'''
+    try:
+        data = schemas.LinkImport.model_validate({
+            key: value for key, value in row.items() if isinstance(key, str) and value not in ('', None)
+        })
+    except ValidationError as err:
+        raise ValueError('; '.join(
+            f'{".".join(str(part) for part in error["loc"])}: {error["msg"]}' for error in err.errors()
+        ))
+    if not isinstance(data.campaign_date, datetime):
+        data.campaign_date = datetime.combine(data.campaign_date, time())
+    elif data.campaign_date.tzinfo is not None:
+        data.campaign_date = data.campaign_date.astimezone().replace(tzinfo=None)
+    if data.short_code is not None:
+        _check_short_code(data.short_code, data.campaign_date)
+    return data
+
+
+class Importer:
+    '''Load link rows chunk by chunk through one session.
+
+    Option ids, medium/source pairs and partitions already seen are kept, so
+    every chunk only queries for what is new to it.
+    '''
+
+    def __init__(self, session: Session, rejects: Rejects, keep_full_url: bool = False):
+        self.session = session
+        self.rejects = rejects
+        self.keep_full_url = keep_full_url
+        self.imported = 0
+        self._option_ids: dict[str, dict[str, int]] = {dimension: {} for dimension in db_tools.LINK_DIMENSIONS}
+        # (medium name, source name)
+        self._pairs: set[tuple[str, str]] = set()
+        self._months: set[date] = set()
+
+    def _ensure_options(self, chunk: list[tuple[int, dict, schemas.LinkImport]]):
+        '''Create the dimensions and medium/source pairs of a chunk that are missing.'''
+        missing = {
+            dimension: {getattr(data, dimension) for _, _, data in chunk} - self._option_ids[dimension].keys()
+            for dimension in db_tools.LINK_DIMENSIONS
+        }
+        pairs = {(data.medium, data.source) for _, _, data in chunk} - self._pairs
+        if pairs or any(missing.values()):
+            for dimension, ids in db_tools.add_options(self.session, missing, pairs).items():
+                self._option_ids[dimension].update(ids)
+            self._pairs |= pairs
+        self.session.commit()
+
+    def _link_values(self, data: schemas.LinkImport) -> dict:
+        '''Link columns of an import row, short_code aside.'''
+        names = {dimension: getattr(data, dimension) for dimension in db_tools.LINK_DIMENSIONS}
+        target_url, full_url = db_tools.make_full_url(
+            data.target_url, data.campaign_date, names, data.campaning_dop, data.sendy_id,
+        )
+        if data.full_url is not None and data.full_url != full_url:
+            if not self.keep_full_url:
+                raise ValueError(f'full_url does not match the generated {full_url!r}')
+            full_url = data.full_url
+        return {
+            'target_url': target_url,
+            'campaign_date': data.campaign_date,
+            'campaign_dop': data.campaning_dop or '0',
+            'full_url': full_url,
+            **{f'{dimension}_id': self._option_ids[dimension][name] for dimension, name in names.items()},
+            **{f'{dimension}_name': name for dimension, name in names.items()},
+        }
+
+    def _taken_short_codes(self, short_codes: set[str]) -> set[str]:
+        '''Given short codes that a link already has, in any partition.'''
+        if not short_codes:
+            return set()
+        return set(self.session.scalars(select(models.Link.short_code).where(models.Link.short_code.in_(short_codes))))
+
+    def load(self, chunk: list[tuple[int, dict, schemas.LinkImport]]):
+        '''Import a chunk of parsed rows in one transaction.
+
+        If COPY hits a taken short code, rows whose given code has been taken
+        since it was checked are rejected and the others tried again with new
+        generated codes.
+        '''
+        months = {data.campaign_date.date().replace(day=1) for _, _, data in chunk} - self._months
+        if months:
+            partitions.ensure_months(months)
+            self._months |= months
+        self._ensure_options(chunk)
+
+        given = {data.short_code for _, _, data in chunk if data.short_code is not None}
+        taken = self._taken_short_codes(given)
+        rows = []
+        for line, row, data in chunk:
+            try:
+                if data.short_code is not None and data.short_code in taken:
+                    raise ValueError(f'Short code {data.short_code!r} is already used')
+                rows.append((line, row, data.short_code, self._link_values(data)))
+                if data.short_code is not None:
+                    taken.add(data.short_code)
+            except ValueError as err:
+                self.rejects.add(line, row, str(err))
+
+        for attempt in range(db_tools.SHORT_CODE_ATTEMPTS):
+            if not rows:
+                return
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for _, _, short_code, values in rows:
+                values['short_code'] = short_code or models.new_short_code(values['campaign_date'])
+                writer.writerow([values[column] for column in LINK_COLUMNS])
+            buffer.seek(0)
+            try:
+                cursor = self.session.connection().connection.cursor()
+                cursor.copy_expert(f'COPY link ({", ".join(LINK_COLUMNS)}) FROM STDIN WITH (FORMAT csv)', buffer)
+                self.session.commit()
+                break
+            except UniqueViolation:
+                self.session.rollback()
+                if attempt == db_tools.SHORT_CODE_ATTEMPTS - 1:
+                    raise
+                # Either a given code was taken by another writer or a
+                # generated code is taken in its partition.
+                taken = self._taken_short_codes(given)
+                kept = []
+                for line, row, short_code, values in rows:
+                    if short_code is not None and short_code in taken:
+                        self.rejects.add(line, row, f'Short code {short_code!r} is already used')
+                    else:
+                        kept.append((line, row, short_code, values))
+                rows = kept
+        self.imported += len(rows)
+
+    def run(self, rows: Iterator[tuple[int, dict, str | None]], chunk_size: int = IMPORT_CHUNK_SIZE):
+        '''Import rows in chunks of chunk_size, logging progress after each.'''
+        started = perf_counter()
+        chunk = []
+        line = 0
+        for line, row, error in rows:
+            if error is None:
+                try:
+                    chunk.append((line, row, _parse(row)))
+                except ValueError as err:
+                    error = str(err)
+            if error is not None:
+                self.rejects.add(line, row, error)
+            if len(chunk) == chunk_size:
+                self._load_logged(chunk, line, started)
+                chunk = []
+        if chunk:
+            self._load_logged(chunk, line, started)
+        logger.info(f'Imported {self.imported} links, rejected {self.rejects.count} rows')
+
+    def _load_logged(self, chunk: list[tuple[int, dict, schemas.LinkImport]], line: int, started: float):
+        self.load(chunk)
+        rate = self.imported / (perf_counter() - started)
+        logger.info(f'Line {line}: {self.imported} imported, {self.rejects.count} rejected, {rate:.0f} links/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='CSV or NDJSON file, - for stdin')
+    parser.add_argument('--format', choices=sorted(set(FORMATS.values())), help='default: from the file suffix')
+    parser.add_argument('--rejects', type=Path, required=True, help='file for the rows that were not imported')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument('--keep-full-url', action='store_true', help='keep given full urls that differ from generated ones')
+    args = parser.parse_args()
+
+    format = args.format or FORMATS.get(Path(args.input).suffix.lower())
+    if format is None:
+        parser.error('cannot tell the format from the file suffix, pass --format')
+
+    file = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    with file, open(args.rejects, 'w', newline='', encoding='utf-8') as rejects_file, db.SessionLocal() as session:
+        importer = Importer(session, Rejects(rejects_file, format), args.keep_full_url)
+        importer.run(read_rows(file, format), args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,51 @@
+from contextlib import asynccontextmanager
+from os import environ
+from time import perf_counter
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+from link_dealer import bitly, clicks, db, idempotency, metrics, partitions, startup, tasks, usage
 from link_dealer.api.routes import routes
 
-app = FastAPI(debug=True)
+DEBUG = environ.get('DEBUG', '').lower() in ('1', 'true', 'yes')
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    await startup.warm_up()
+
+    background = [
+        tasks.PeriodicTask(usage.flush, usage.USAGE_FLUSH_INTERVAL),
+        clicks.make_flusher(),
+        tasks.PeriodicTask(partitions.ensure, partitions.PARTITION_CHECK_INTERVAL),
+        tasks.PeriodicTask(idempotency.cleanup, idempotency.IDEMPOTENCY_CLEANUP_INTERVAL),
+    ]
+    if bitly.TOKEN_BITLY:
+        background.append(bitly.make_flusher())
+    for task in background:
+        task.start()
+    yield
+    for task in background:
+        await run_in_threadpool(task.stop)
+    await run_in_threadpool(bitly.close)
+
+
+def create_app() -> FastAPI:
+    '''Build the app.
+
+    Nothing here touches the database or starts threads, so under gunicorn
+    --preload it is built once in the master and shared by the forked workers.
+    '''
+    started = perf_counter()
+    app = FastAPI(debug=DEBUG, lifespan=lifespan)
+    app.add_middleware(db.ReadYourWritesMiddleware)
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(routes)
+    # Built lazily on the first /docs visit otherwise.
+    app.openapi()
+    logger.info(f'App built in {perf_counter() - started:.2f}s')
+    return app
+
 
-app.include_router(routes)
+app = create_app()
@@ -0,0 +1,165 @@
+import os
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from time import perf_counter
+
+from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+# Slower requests are logged with their statements; 0 disables the log.
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', '0'))
+SLOW_REQUEST_MAX_STATEMENTS = 20
+# Set by the deployment when gunicorn runs several workers.
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Request latency, including a streamed body.', ['method', 'route', 'status'],
+)
+REQUEST_STATEMENTS = Histogram(
+    'db_statements_per_request', 'SQL statements run by one request.', ['route'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+REQUEST_DB_SECONDS = Histogram('db_time_per_request_seconds', 'Time spent in SQL statements by one request.', ['route'])
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+POOL_WAIT_SECONDS = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time one checkout waited for a pooled connection.', buckets=POOL_WAIT_BUCKETS,
+)
+REQUEST_POOL_WAIT_SECONDS = Histogram(
+    'db_pool_wait_per_request_seconds', 'Time one request waited for pooled connections.', ['route'],
+    buckets=(0, *POOL_WAIT_BUCKETS),
+)
+
+
+@dataclass
+class RequestStats:
+    '''Database work of one request.'''
+
+    statements: int = 0
+    db_seconds: float = 0.0
+    pool_wait_seconds: float = 0.0
+    # (seconds, statement) of the first SLOW_REQUEST_MAX_STATEMENTS statements.
+    log: list[tuple[float, str]] = field(default_factory=list)
+
+
+# The threadpool and run_sync copy the context, so db work of a request
+# updates the same RequestStats whatever thread runs it.
+_request_stats: ContextVar[RequestStats | None] = ContextVar('request_stats', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info['query_started_at'].pop()
+    stats = _request_stats.get()
+    if stats is None:
+        return
+    stats.statements += 1
+    stats.db_seconds += elapsed
+    if SLOW_REQUEST_SECONDS and len(stats.log) < SLOW_REQUEST_MAX_STATEMENTS:
+        stats.log.append((elapsed, statement))
+
+
+def _handle_error(context):
+    started = context.connection.info.get('query_started_at') if context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument(engine: Engine):
+    '''Count statements and their time for the current request.'''
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+def timed_pool(pool_class: type[Pool]) -> type[Pool]:
+    '''Subclass of pool_class that observes how long checkouts wait.'''
+    class TimedPool(pool_class):
+        def _do_get(self):
+            started = perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                elapsed = perf_counter() - started
+                POOL_WAIT_SECONDS.observe(elapsed)
+                stats = _request_stats.get()
+                if stats is not None:
+                    stats.pool_wait_seconds += elapsed
+
+    TimedPool.__name__ = f'Timed{pool_class.__name__}'
+    TimedPool.__qualname__ = TimedPool.__name__
+    return TimedPool
+
+
+class MetricsMiddleware:
+    '''Observe latency and database work per route.
+
+    A pure ASGI middleware, so streamed bodies are included.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: dict[object, str] | None = None
+
+    def _route(self, scope) -> str:
+        if self._routes is None:
+            self._routes = {
+                route.endpoint: route.path for route in scope['app'].routes if hasattr(route, 'endpoint')
+            }
+        return self._routes.get(scope.get('endpoint'), UNMATCHED_ROUTE)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = perf_counter() - started
+            _request_stats.reset(token)
+            # The router sets the endpoint on the same scope.
+            route = self._route(scope)
+            REQUEST_SECONDS.labels(scope['method'], route, str(status)).observe(elapsed)
+            REQUEST_STATEMENTS.labels(route).observe(stats.statements)
+            REQUEST_DB_SECONDS.labels(route).observe(stats.db_seconds)
+            REQUEST_POOL_WAIT_SECONDS.labels(route).observe(stats.pool_wait_seconds)
+            if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS:
+                _log_slow_request(scope, status, elapsed, stats)
+
+
+def _log_slow_request(scope, status: int, elapsed: float, stats: RequestStats):
+    statements = '\n'.join(f'  {seconds * 1000:.1f} ms: {statement}' for seconds, statement in stats.log)
+    logger.warning(
+        f'Slow request {scope["method"]} {scope["path"]} -> {status} in {elapsed * 1000:.1f} ms, '
+        f'{stats.statements} statements in {stats.db_seconds * 1000:.1f} ms, '
+        f'{stats.pool_wait_seconds * 1000:.1f} ms waiting for connections\n{statements}'
+    )
+
+
+def render() -> tuple[bytes, str]:
+    '''Metrics in the Prometheus text format, merged across workers in multiprocess mode.'''
+    registry = REGISTRY
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,6 +1,41 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey, Table, Column
-from datetime import datetime
+from sqlalchemy import BigInteger, ForeignKey, Table, Column, Index, func
+from datetime import date, datetime
+import secrets
+import string
+
+SHORT_CODE_ALPHABET = string.ascii_letters + string.digits
+# Two characters of campaign month, then random ones. Codes made before
+# link was partitioned are 8 random characters or '_<hex id>'.
+SHORT_CODE_LENGTH = 9
+SHORT_CODE_EPOCH = 2000
+
+
+def new_short_code(campaign_date: datetime) -> str:
+    '''Make a random short code for a link of a campaign date.
+
+    Codes only need to be unique within a month, i.e. within a partition of
+    link, as the month is part of the code.
+    '''
+    high, low = divmod((campaign_date.year - SHORT_CODE_EPOCH) * 12 + campaign_date.month - 1, len(SHORT_CODE_ALPHABET))
+    prefix = SHORT_CODE_ALPHABET[high] + SHORT_CODE_ALPHABET[low]
+    return prefix + ''.join(secrets.choice(SHORT_CODE_ALPHABET) for _ in range(SHORT_CODE_LENGTH - 2))
+
+
+def short_code_month(short_code: str) -> date | None:
+    '''First day of the campaign month of a short code, if the code has one.'''
+    if len(short_code) != SHORT_CODE_LENGTH:
+        return None
+    try:
+        high, low = SHORT_CODE_ALPHABET.index(short_code[0]), SHORT_CODE_ALPHABET.index(short_code[1])
+    except ValueError:
+        return None
+    year, month = divmod(high * len(SHORT_CODE_ALPHABET) + low, 12)
+    return date(SHORT_CODE_EPOCH + year, month + 1, 1)
+
+
+def _default_short_code(context) -> str:
+    return new_short_code(context.get_current_parameters().get('campaign_date') or datetime.now())
 
 
 class Base(DeclarativeBase):
@@ -12,6 +47,7 @@ medium_source = Table(
     Base.metadata,
     Column('medium_id', ForeignKey('medium.id')),
     Column('source_id', ForeignKey('source.id')),
+    Index('ix_medium_source_medium_id_source_id', 'medium_id', 'source_id', unique=True),
 )
 
 
@@ -19,42 +55,67 @@ class Link(Base):
     '''Link.'''
 
     __tablename__ = 'link'
+    # Monthly partitions are managed by link_dealer.partitions; each has a
+    # unique index on short_code. `<dimension>_name` copies the option name
+    # so that reads need no joins; update_info keeps it in sync.
+    __table_args__ = {'postgresql_partition_by': 'RANGE (campaign_date)'}
 
-    id: Mapped[int] = mapped_column(primary_key=True)
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     target_url: Mapped[str] = mapped_column()
-    campaign_date: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+    campaign_date: Mapped[datetime] = mapped_column(primary_key=True, default=datetime.utcnow)
     campaign_dop: Mapped[str] = mapped_column(default='0')
     full_url: Mapped[str] = mapped_column()
+    short_code: Mapped[str] = mapped_column(default=_default_short_code)
+    # Set by link_dealer.bitly once the link is shortened.
+    short_url: Mapped[str | None] = mapped_column()
 
     term_material_id: Mapped[int] = mapped_column(ForeignKey('term_material.id'))
+    term_material_name: Mapped[str] = mapped_column()
     term_material: Mapped['TermMaterial'] = relationship('TermMaterial', back_populates='links')
 
     term_page_id: Mapped[int] = mapped_column(ForeignKey('term_page.id'))
+    term_page_name: Mapped[str] = mapped_column()
     term_page: Mapped['TermPage'] = relationship('TermPage', back_populates='links')
 
     medium_id: Mapped[int] = mapped_column(ForeignKey('medium.id'))
+    medium_name: Mapped[str] = mapped_column()
     medium: Mapped['Medium'] = relationship('Medium', back_populates='links')
 
     source_id: Mapped[int] = mapped_column(ForeignKey('source.id'))
+    source_name: Mapped[str] = mapped_column()
     source: Mapped['Source'] = relationship('Source', back_populates='links')
 
     campaign_project_id: Mapped[int] = mapped_column(ForeignKey('campaign_project.id'))
+    campaign_project_name: Mapped[str] = mapped_column()
     campaign_project: Mapped['CampaignProject'] = relationship('CampaignProject', back_populates='links')
 
     content_id: Mapped[int] = mapped_column(ForeignKey('content.id'))
+    content_name: Mapped[str] = mapped_column()
     content: Mapped['Content'] = relationship('Content', back_populates='links')
 
     user_id: Mapped[int] = mapped_column(ForeignKey('user.id'))
+    user_name: Mapped[str] = mapped_column()
     user: Mapped['User'] = relationship('User', back_populates='links')
 
 
+Index('ix_link_campaign_date_id', Link.campaign_date.desc(), Link.id.desc())
+Index('ix_link_full_url', Link.full_url, postgresql_using='hash')
+# Link filters of GET /api/links, each in keyset order.
+for _dimension in ('term_material', 'term_page', 'medium', 'source', 'campaign_project', 'user'):
+    Index(
+        f'ix_link_{_dimension}_id_campaign_date_id',
+        getattr(Link, f'{_dimension}_id'), Link.campaign_date.desc(), Link.id.desc(),
+    )
+Index('ix_link_target_url_pattern', Link.target_url, postgresql_ops={'target_url': 'varchar_pattern_ops'})
+
+
 class TermMaterial(Base):
     '''TermMaterial.'''
 
     __tablename__ = 'term_material'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column()
+    name: Mapped[str] = mapped_column(index=True, unique=True)
     weight: Mapped[int] = mapped_column(default=0)
 
     links: Mapped[list['Link']] = relationship('Link', back_populates='term_material')
@@ -66,7 +127,7 @@ class TermPage(Base):
     __tablename__ = 'term_page'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column()
+    name: Mapped[str] = mapped_column(index=True, unique=True)
     weight: Mapped[int] = mapped_column(default=0)
 
     links: Mapped[list['Link']] = relationship('Link', back_populates='term_page')
@@ -78,7 +139,7 @@ class Medium(Base):
     __tablename__ = 'medium'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column()
+    name: Mapped[str] = mapped_column(index=True, unique=True)
     weight: Mapped[int] = mapped_column(default=0)
 
     links: Mapped[list['Link']] = relationship('Link', back_populates='medium')
@@ -96,7 +157,7 @@ class Source(Base):
     __tablename__ = 'source'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column()
+    name: Mapped[str] = mapped_column(index=True, unique=True)
     weight: Mapped[int] = mapped_column(default=0)
 
     links: Mapped[list['Link']] = relationship('Link', back_populates='source')
@@ -114,7 +175,7 @@ class CampaignProject(Base):
     __tablename__ = 'campaign_project'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column()
+    name: Mapped[str] = mapped_column(index=True, unique=True)
     weight: Mapped[int] = mapped_column(default=0)
 
     links: Mapped[list['Link']] = relationship('Link', back_populates='campaign_project')
@@ -126,7 +187,7 @@ class Content(Base):
     __tablename__ = 'content'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column()
+    name: Mapped[str] = mapped_column(index=True, unique=True)
     weight: Mapped[int] = mapped_column(default=0)
 
     links: Mapped[list['Link']] = relationship('Link', back_populates='content')
@@ -138,8 +199,52 @@ class User(Base):
     __tablename__ = 'user'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column()
+    name: Mapped[str] = mapped_column(index=True, unique=True)
     is_bot: Mapped[bool] = mapped_column(default=False)
     weight: Mapped[int] = mapped_column(default=0)
 
     links: Mapped[list['Link']] = relationship('Link', back_populates='user')
+
+
+class TaxonomyVersion(Base):
+    '''TaxonomyVersion.'''
+
+    __tablename__ = 'taxonomy_version'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(default=0)
+    decayed_at: Mapped[datetime] = mapped_column(server_default=func.now())
+
+
+class Click(Base):
+    '''Click.'''
+
+    __tablename__ = 'click'
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # No foreign key: link ids are not unique on their own in partitioned link.
+    link_id: Mapped[int] = mapped_column(index=True)
+    clicked_at: Mapped[datetime] = mapped_column()
+
+
+class ClickDaily(Base):
+    '''Clicks of a link per day.'''
+
+    __tablename__ = 'click_daily'
+
+    link_id: Mapped[int] = mapped_column(primary_key=True)
+    day: Mapped[date] = mapped_column(primary_key=True)
+    clicks: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class IdempotencyKey(Base):
+    '''Link created for an Idempotency-Key of create_link.'''
+
+    __tablename__ = 'idempotency_key'
+
+    key: Mapped[str] = mapped_column(primary_key=True)
+    # sha256 of the request the key was first used with.
+    request_hash: Mapped[str] = mapped_column()
+    # The schemas.Link JSON answered then.
+    response: Mapped[str] = mapped_column()
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now(), index=True)
@@ -0,0 +1,144 @@
+'''Monthly partitions of link.
+
+    python -m link_dealer.partitions ensure [--months-ahead 3]
+    python -m link_dealer.partitions archive --keep-months 24 --dir archive/
+
+`ensure` creates the partitions from the current month on; the app also
+runs it at startup and every PARTITION_CHECK_INTERVAL seconds. `archive`
+copies every partition older than --keep-months to <dir>/<partition>.csv.gz
+and then detaches and drops it.
+'''
+import argparse
+import gzip
+import os
+import re
+from datetime import date, datetime
+from os import environ
+from pathlib import Path
+from typing import Iterable
+
+from loguru import logger
+from sqlalchemy import Connection, text
+
+from link_dealer import db
+
+PARTITION_MONTHS_AHEAD = int(environ.get('PARTITION_MONTHS_AHEAD', '3'))
+PARTITION_CHECK_INTERVAL = float(environ.get('PARTITION_CHECK_INTERVAL', '86400'))
+PARTITION_NAME = re.compile(r'^link_p(\d{4})(\d{2})$')
+# pg_advisory_xact_lock key serializing partition DDL across workers.
+LOCK_KEY = 0x6c696e6b
+
+
+def add_months(month: date, months: int) -> date:
+    '''First day of the month `months` after the month of `month`.'''
+    year, month_index = divmod(month.year * 12 + month.month - 1 + months, 12)
+    return date(year, month_index + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'link_p{month:%Y%m}'
+
+
+def _partitions(conn: Connection) -> dict[date, str]:
+    '''Attached partitions of link by month.'''
+    names = conn.scalars(text('''
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE parent.relname = 'link'
+    '''))
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def _create_partition(conn: Connection, month: date):
+    name = partition_name(month)
+    conn.execute(text(
+        f"CREATE TABLE {name} PARTITION OF link FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+    ))
+    conn.execute(text(f'CREATE UNIQUE INDEX ix_{name}_short_code ON {name} (short_code)'))
+
+
+def ensure(months_ahead: int = PARTITION_MONTHS_AHEAD) -> list[str]:
+    '''Create the missing partitions from the current month to months_ahead months later.'''
+    current = datetime.now().date().replace(day=1)
+    return ensure_months([add_months(current, i) for i in range(months_ahead + 1)])
+
+
+def ensure_months(months: Iterable[date]) -> list[str]:
+    '''Create the missing partitions of the months of these dates.'''
+    months = sorted({month.replace(day=1) for month in months})
+    with db.engine.connect() as conn:
+        if all(month in _partitions(conn) for month in months):
+            return []
+
+    created = []
+    with db.engine.begin() as conn:
+        conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': LOCK_KEY})
+        existing = _partitions(conn)
+        for month in months:
+            if month not in existing:
+                _create_partition(conn, month)
+                created.append(partition_name(month))
+    if created:
+        logger.info(f'Created link partitions {", ".join(created)}')
+    return created
+
+
+def archive(keep_months: int, directory: Path) -> list[Path]:
+    '''Archive and drop the partitions older than keep_months months.
+
+    A partition is dropped only after its gzipped CSV copy is on disk, so an
+    interrupted run leaves it attached and can simply be repeated.
+    '''
+    before = add_months(datetime.now().date().replace(day=1), -keep_months)
+    with db.engine.connect() as conn:
+        old = sorted((month, name) for month, name in _partitions(conn).items() if month < before)
+
+    directory.mkdir(parents=True, exist_ok=True)
+    archived = []
+    for _, name in old:
+        path = directory / f'{name}.csv.gz'
+        partial = path.with_name(path.name + '.partial')
+        raw = db.engine.raw_connection()
+        try:
+            with gzip.open(partial, 'wb') as file:
+                raw.cursor().copy_expert(f'COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)', file)
+                file.flush()
+                os.fsync(file.fileno())
+            partial.replace(path)
+            raw.rollback()
+        finally:
+            raw.close()
+
+        with db.engine.begin() as conn:
+            conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': LOCK_KEY})
+            conn.execute(text(f'ALTER TABLE link DETACH PARTITION {name}'))
+            conn.execute(text(f'DROP TABLE {name}'))
+        logger.info(f'Archived {name} to {path}')
+        archived.append(path)
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    ensure_parser = commands.add_parser('ensure', help='create missing partitions')
+    ensure_parser.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD)
+    archive_parser = commands.add_parser('archive', help='archive and drop old partitions')
+    archive_parser.add_argument('--keep-months', type=int, required=True)
+    archive_parser.add_argument('--dir', type=Path, required=True)
+    args = parser.parse_args()
+
+    if args.command == 'ensure':
+        ensure(args.months_ahead)
+    else:
+        archive(args.keep_months, args.dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,13 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
 
 
 class BaseOption(BaseModel):
     '''BaseOption.'''
 
+    model_config = ConfigDict(frozen=True)
+
     ident: Optional[int] = None
     value: str
 
@@ -29,6 +31,8 @@ class Link(BaseModel):
     campaign_date: datetime
     campaign_dop: str
     full_url: str
+    short_code: Optional[str] = None
+    short_url: Optional[str] = None
     term_material_id: int
     term_material_name: str
     term_page_id: int
@@ -48,12 +52,16 @@ class Link(BaseModel):
 class Info(BaseModel):
     '''Info.'''
 
+    model_config = ConfigDict(frozen=True)
+
     users: list['User'] = []
     term_materials: list['BaseOption'] = []
     term_pages: list['BaseOption'] = []
     mediums: list['Medium'] = []
     campaign_projects: list['BaseOption'] = []
     contents: list['BaseOption'] = []
+    # Idents of the sources of all mediums, heaviest first; not serialized.
+    _source_order: tuple[int, ...] = ()
 
 
 class LinkCreate(BaseModel):
@@ -71,7 +79,90 @@ class LinkCreate(BaseModel):
     user: int | str
 
 
+class LinkError(BaseModel):
+    '''LinkError.'''
+
+    index: int
+    detail: str
+
+
+class CreatedLinks(BaseModel):
+    '''CreatedLinks.'''
+
+    links: list[Optional[Link]] = []
+    errors: list[LinkError] = []
+
+
+class PreviewLinks(BaseModel):
+    '''PreviewLinks.'''
+
+    target_url: str
+    sources: list[int | str]
+    mediums: list[int | str]
+    campaign_projects: list[int | str]
+    campaning_dop: str = '0'
+    sendy_id: int | str = '0'
+    contents: list[int | str] = ['0']
+    term_materials: list[int | str]
+    term_pages: list[int | str]
+
+
 class LastLinks(BaseModel):
     '''LastLinks.'''
 
-    links: list[Link] = []
\ No newline at end of file
+    links: list[Link] = []
+    next_cursor: Optional[str] = None
+
+
+class LinkFilter(BaseModel):
+    '''LinkFilter.'''
+
+    term_material_id: Optional[int] = None
+    term_page_id: Optional[int] = None
+    medium_id: Optional[int] = None
+    source_id: Optional[int] = None
+    campaign_project_id: Optional[int] = None
+    content_id: Optional[int] = None
+    user_id: Optional[int] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    target_url_prefix: Optional[str] = None
+
+
+class ClickEvent(BaseModel):
+    '''ClickEvent.'''
+
+    link_id: Optional[int] = None
+    full_url: Optional[str] = None
+    clicked_at: Optional[datetime] = None
+
+
+class ClickBatch(BaseModel):
+    '''ClickBatch.'''
+
+    clicks: list[ClickEvent] = []
+
+
+class ClicksAccepted(BaseModel):
+    '''ClicksAccepted.'''
+
+    accepted: int
+    rejected: int
+
+
+class LinkImport(BaseModel):
+    '''LinkImport.'''
+
+    target_url: str
+    campaign_date: datetime | date
+    source: str
+    medium: str
+    campaign_project: str
+    campaning_dop: str = '0'
+    sendy_id: int | str = '0'
+    content: str = '0'
+    term_material: str
+    term_page: str
+    user: str
+    full_url: Optional[str] = None
+    short_code: Optional[str] = None
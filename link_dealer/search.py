@@ -0,0 +1,151 @@
+import heapq
+import sys
+from bisect import bisect_left
+from threading import Lock
+from typing import Iterable, Literal
+
+from link_dealer import schemas
+
+Kind = Literal['users', 'term_materials', 'term_pages', 'mediums', 'sources', 'campaign_projects', 'contents']
+NGRAM = 3
+# Wider prefix ranges are scanned in rank order instead of sorted.
+PREFIX_SORT_MAX = 256
+
+
+def _prefix_end(prefix: str) -> str | None:
+    '''Smallest string above every string starting with prefix, None if there is none.'''
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class OptionIndex:
+    '''Prefix and substring index over options ordered by weight, heaviest first.
+
+    Options are identified by their rank, i.e. their position in that order,
+    so the first matches found are the top-weighted ones.
+    '''
+
+    def __init__(self, options: tuple[schemas.BaseOption, ...]):
+        self.options = options
+        self.rank_by_ident = {option.ident: rank for rank, option in enumerate(options)}
+        self._names = [option.value.casefold() for option in options]
+        self._by_name = sorted((name, rank) for rank, name in enumerate(self._names))
+        self._sorted_names = [name for name, _ in self._by_name]
+        # ngram -> ranks of the options containing it, ascending.
+        self._postings: dict[str, list[int]] = {}
+        for rank, name in enumerate(self._names):
+            for gram in {name[i:i + NGRAM] for i in range(len(name) - NGRAM + 1)}:
+                self._postings.setdefault(gram, []).append(rank)
+
+    def _prefix_ranks(self, query: str, limit: int, allowed: set[int] | None) -> list[int]:
+        '''Top ranks of the options starting with query.'''
+        start = bisect_left(self._sorted_names, query)
+        end = _prefix_end(query)
+        end = len(self._sorted_names) if end is None else bisect_left(self._sorted_names, end, start)
+        if end - start <= PREFIX_SORT_MAX:
+            return heapq.nsmallest(limit, (
+                rank for _, rank in self._by_name[start:end] if allowed is None or rank in allowed
+            ))
+        # Many options match, so the top ones come early in rank order.
+        found = []
+        for rank in self._substring_candidates(query):
+            if self._names[rank].startswith(query) and (allowed is None or rank in allowed):
+                found.append(rank)
+                if len(found) == limit:
+                    break
+        return found
+
+    def _substring_candidates(self, query: str) -> Iterable[int]:
+        '''Ranks that may contain query, ascending.'''
+        if len(query) < NGRAM:
+            return range(len(self._names))
+        postings = [self._postings.get(query[i:i + NGRAM]) for i in range(len(query) - NGRAM + 1)]
+        if not all(postings):
+            return ()
+        return min(postings, key=len)
+
+    def search(self, query: str, limit: int, allowed: set[int] | None = None) -> list[schemas.BaseOption]:
+        '''Top-weighted options starting with query, then the ones containing it.
+
+        `allowed` restricts the result to these ranks.
+        '''
+        query = query.casefold()
+        if not query:
+            ranks = range(len(self._names)) if allowed is None else sorted(allowed)
+            return [self.options[rank] for rank in ranks[:limit]]
+
+        prefix = self._prefix_ranks(query, limit, allowed)
+        found = prefix
+        if len(prefix) < limit:
+            found = prefix.copy()
+            for rank in self._substring_candidates(query):
+                name = self._names[rank]
+                if (allowed is None or rank in allowed) and query in name and not name.startswith(query):
+                    found.append(rank)
+                    if len(found) == limit:
+                        break
+        return [self.options[rank] for rank in found]
+
+
+class TaxonomyIndex:
+    '''Option indexes of every kind for one taxonomy version.'''
+
+    def __init__(self, version: int, info: schemas.Info, previous: 'TaxonomyIndex | None' = None):
+        self.version = version
+        sources = {}
+        for medium in info.mediums:
+            for source in medium.sources:
+                sources.setdefault(source.ident, source)
+        # Sources are ranked by their own weight, not by the medium they first appear under.
+        order = {ident: position for position, ident in enumerate(info._source_order)}
+        sources = sorted(sources.values(), key=lambda source: order.get(source.ident, len(order)))
+        options: dict[str, tuple[schemas.BaseOption, ...]] = {
+            'users': tuple(info.users),
+            'term_materials': tuple(info.term_materials),
+            'term_pages': tuple(info.term_pages),
+            'mediums': tuple(schemas.BaseOption(ident=medium.ident, value=medium.value) for medium in info.mediums),
+            'sources': tuple(sources),
+            'campaign_projects': tuple(info.campaign_projects),
+            'contents': tuple(info.contents),
+        }
+        # Kinds the update did not touch keep their index.
+        self.indexes = {
+            kind: previous.indexes[kind] if previous and previous.indexes[kind].options == kind_options
+            else OptionIndex(kind_options)
+            for kind, kind_options in options.items()
+        }
+        source_ranks = self.indexes['sources'].rank_by_ident
+        self.medium_sources = {
+            medium.ident: {source_ranks[source.ident] for source in medium.sources} for medium in info.mediums
+        }
+
+    def search(self, kind: Kind, query: str, limit: int, medium: int | None = None) -> list[schemas.BaseOption]:
+        '''Search options of a kind; sources can be restricted to a medium.'''
+        allowed = None
+        if kind == 'sources' and medium is not None:
+            allowed = self.medium_sources.get(medium, set())
+        return self.indexes[kind].search(query, limit, allowed)
+
+
+_index: TaxonomyIndex | None = None
+_lock = Lock()
+
+
+def cached_index(version: int) -> TaxonomyIndex | None:
+    '''Get the worker index if it was built for this taxonomy version.'''
+    index = _index
+    if index and index.version == version:
+        return index
+    return None
+
+
+def get_index(version: int, info: schemas.Info) -> TaxonomyIndex:
+    '''Get the index of a taxonomy snapshot, building it at most once per version.'''
+    global _index
+    with _lock:
+        index = cached_index(version)
+        if index is None:
+            index = _index = TaxonomyIndex(version, info, _index)
+        return index
@@ -0,0 +1,45 @@
+'''Worker warm-up.
+
+Runs in the lifespan of each worker, before it takes traffic: the pool gets
+its first connections and the taxonomy snapshot, its search index and the
+encoded info response are built, so first requests find them ready.
+'''
+from time import perf_counter
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from link_dealer import db, db_tools, partitions, search
+from link_dealer.api import service
+
+# Set once a warm-up has succeeded; /ready answers 503 until then.
+ready = False
+
+
+def _warm_taxonomy(version: int, info):
+    search.get_index(version, info)
+    service.warm_json_response('info', version, info)
+
+
+async def warm_up() -> bool:
+    '''Warm the worker up. Return whether it is ready for traffic.'''
+    global ready
+    started = perf_counter()
+    try:
+        await run_in_threadpool(partitions.ensure)
+    except Exception:
+        logger.exception('Creating link partitions failed')
+    try:
+        if db.ASYNC_DB:
+            await db.warm_up_async()
+            version, info = await db_tools.get_info_snapshot_async()
+        else:
+            await run_in_threadpool(db.warm_up)
+            version, info = await run_in_threadpool(db_tools.get_info_snapshot)
+        await run_in_threadpool(_warm_taxonomy, version, info)
+    except Exception:
+        logger.exception('Warm-up failed')
+        return False
+    ready = True
+    logger.info(f'Worker warmed up in {perf_counter() - started:.2f}s')
+    return True
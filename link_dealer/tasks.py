@@ -0,0 +1,36 @@
+from threading import Event, Thread
+from typing import Callable
+
+from loguru import logger
+
+
+class PeriodicTask(Thread):
+    '''Call func every interval seconds in a daemon thread.
+
+    `wake()` runs it early; `stop()` runs it one last time and waits for the
+    thread to finish, so buffered work is flushed on shutdown.
+    '''
+
+    def __init__(self, func: Callable[[], object], interval: float):
+        super().__init__(name=func.__qualname__, daemon=True)
+        self.func = func
+        self.interval = interval
+        self._wakeup = Event()
+        self._stopped = Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self.join()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.func()
+            except Exception:
+                logger.exception(f'{self.name} failed')
@@ -0,0 +1,108 @@
+from collections import Counter
+from datetime import timedelta
+from os import environ
+from threading import Lock
+
+from sqlalchemy import Integer, Numeric, and_, cast, column, exists, func, literal, select, tuple_, update, values
+from sqlalchemy.orm import Session
+
+from link_dealer import db, models
+
+USAGE_FLUSH_INTERVAL = float(environ.get('USAGE_FLUSH_INTERVAL', '60'))
+# Weights are multiplied by USAGE_DECAY once per USAGE_DECAY_INTERVAL seconds; 1 disables decay.
+USAGE_DECAY = float(environ.get('USAGE_DECAY', '1'))
+USAGE_DECAY_INTERVAL = float(environ.get('USAGE_DECAY_INTERVAL', '86400'))
+
+# (dimension model, option id) -> uses since the last flush, for this worker.
+_counts: Counter[tuple[type[models.Base], int]] = Counter()
+_lock = Lock()
+
+
+def record(options: dict[type[models.Base], int]):
+    '''Count one use of each option of a created link.'''
+    with _lock:
+        _counts.update(options.items())
+
+
+def _decay(session: Session) -> bool:
+    '''Decay every weight if no worker has done so for USAGE_DECAY_INTERVAL.
+
+    Weights are rounded half up, so an option used once keeps weight 1 unless
+    USAGE_DECAY is below 0.5.
+    '''
+    claimed = session.scalar(
+        update(models.TaxonomyVersion)
+        .where(models.TaxonomyVersion.decayed_at < func.now() - timedelta(seconds=USAGE_DECAY_INTERVAL))
+        .values(decayed_at=func.now())
+        .returning(models.TaxonomyVersion.id)
+    )
+    if claimed is None:
+        return False
+    for model in (models.TermMaterial, models.TermPage, models.Medium, models.Source,
+                  models.CampaignProject, models.Content, models.User):
+        session.execute(
+            update(model)
+            .where(model.weight != 0)
+            .values(weight=cast(func.round(model.weight * literal(USAGE_DECAY, Numeric)), Integer))
+        )
+    return True
+
+
+def _order_changed(session: Session, model: type[models.Base], rows: list[tuple[int, int]]) -> bool:
+    '''Whether adding uses to these options has moved one ahead of another option.
+
+    Options are ordered by weight, heaviest first, then by id. A used option
+    can only move up, past options whose weight is now between its old and
+    new weight; the other option may have been used too.
+    '''
+    used = values(column('id', Integer), column('uses', Integer), name='used').data(rows)
+    other_used = values(column('id', Integer), column('uses', Integer), name='other_used').data(rows)
+    option = model.__table__.alias('option')
+    other = model.__table__.alias('other')
+    old_weight = option.c.weight - used.c.uses
+    other_old_weight = other.c.weight - func.coalesce(other_used.c.uses, 0)
+    return session.scalar(select(exists(
+        select(option.c.id)
+        .select_from(used)
+        .join(option, option.c.id == used.c.id)
+        .join(other, and_(other.c.id != option.c.id, other.c.weight.between(old_weight, option.c.weight)))
+        .outerjoin(other_used, other_used.c.id == other.c.id)
+        .where(
+            tuple_(other_old_weight, -other.c.id) > tuple_(old_weight, -option.c.id),
+            tuple_(other.c.weight, -other.c.id) < tuple_(option.c.weight, -option.c.id),
+        )
+    )))
+
+
+def flush():
+    '''Add the counted uses to option weights with one UPDATE per dimension.
+
+    The taxonomy version, and with it every worker's snapshot, only changes
+    when the order of options has.
+    '''
+    global _counts
+    with _lock:
+        counts, _counts = _counts, Counter()
+    if not counts and USAGE_DECAY == 1:
+        return
+
+    by_model: dict[type[models.Base], list[tuple[int, int]]] = {}
+    for (model, option_id), uses in counts.items():
+        by_model.setdefault(model, []).append((option_id, uses))
+    try:
+        with db.SessionLocal() as session:
+            changed = USAGE_DECAY != 1 and _decay(session)
+            for model, rows in by_model.items():
+                used = values(column('id', Integer), column('uses', Integer), name='used').data(rows)
+                session.execute(
+                    update(model).where(model.id == used.c.id).values(weight=model.weight + used.c.uses),
+                    execution_options={'synchronize_session': False},
+                )
+                changed = changed or _order_changed(session, model, rows)
+            if changed:
+                session.execute(update(models.TaxonomyVersion).values(version=models.TaxonomyVersion.version + 1))
+            session.commit()
+    except Exception:
+        with _lock:
+            _counts.update(counts)
+        raise
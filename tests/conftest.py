@@ -0,0 +1,48 @@
+'''Fixtures of the tests that need Postgres.
+
+Point both urls at throwaway databases, they are wiped and migrated to head:
+
+    TEST_DATABASE_URL=postgres://user@localhost/link_dealer_test \
+    TEST_REPLICA_DATABASE_URL=postgres://user@localhost/link_dealer_test_replica \
+        python -m pytest
+
+The replica database stands in for a streaming replica: rows written to the
+primary only play the part of replication lag.
+'''
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+if os.environ.get('TEST_DATABASE_URL'):
+    os.environ['DATABASE_URL'] = os.environ['TEST_DATABASE_URL']
+if os.environ.get('TEST_REPLICA_DATABASE_URL'):
+    os.environ['DATABASE_REPLICA_URL'] = os.environ['TEST_REPLICA_DATABASE_URL']
+
+ROOT_PATH = Path(__file__).resolve().parent.parent
+
+
+def _migrate(url: str):
+    '''Wipe a database and migrate it to head.'''
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(url.replace('postgres', 'postgresql+psycopg2'))
+    with engine.begin() as conn:
+        conn.execute(text('DROP SCHEMA public CASCADE'))
+        conn.execute(text('CREATE SCHEMA public'))
+    engine.dispose()
+    subprocess.run(
+        [sys.executable, '-m', 'alembic', 'upgrade', 'head'],
+        cwd=ROOT_PATH, env={**os.environ, 'DATABASE_URL': url}, check=True, capture_output=True,
+    )
+
+
+@pytest.fixture(scope='session')
+def databases():
+    '''Migrated primary and replica databases.'''
+    if not (os.environ.get('TEST_DATABASE_URL') and os.environ.get('TEST_REPLICA_DATABASE_URL')):
+        pytest.skip('TEST_DATABASE_URL and TEST_REPLICA_DATABASE_URL are not set')
+    _migrate(os.environ['TEST_DATABASE_URL'])
+    _migrate(os.environ['TEST_REPLICA_DATABASE_URL'])
@@ -0,0 +1,121 @@
+import json
+from time import monotonic
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from link_dealer import bitly, db, db_tools, models, schemas
+
+INFO = schemas.Info(
+    users=[schemas.User(value='bitly user')],
+    term_materials=[schemas.BaseOption(value='bitly material')],
+    term_pages=[schemas.BaseOption(value='bitly page')],
+    mediums=[schemas.Medium(value='bitly medium', sources=[schemas.BaseOption(value='bitly source')])],
+    campaign_projects=[schemas.BaseOption(value='bitly project')],
+    contents=[schemas.BaseOption(value='bitly content')],
+)
+
+
+@pytest.fixture(scope='module')
+def taxonomy(databases):
+    db_tools.update_info(INFO)
+
+
+@pytest.fixture
+def bitly_api(monkeypatch, taxonomy):
+    '''Route the flusher to a mock Bitly answering by the path of long_url.
+
+    /ok is shortened, /refused answers 403, /malformed a 2xx without a link,
+    /limited 429 with a long Retry-After once and /down always 503.
+    '''
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        long_url = json.loads(request.content)['long_url']
+        path = httpx.URL(long_url).path
+        requests.append(path)
+        if path == '/refused':
+            return httpx.Response(403, json={'message': 'FORBIDDEN'})
+        if path == '/malformed':
+            return httpx.Response(201, json={'id': 'bit.ly/none'})
+        if path == '/limited' and requests.count(path) == 1:
+            return httpx.Response(429, headers={'Retry-After': '3600'})
+        if path == '/down':
+            return httpx.Response(503)
+        return httpx.Response(201, json={'link': f'https://bit.ly{path}'})
+
+    monkeypatch.setattr(bitly, 'TOKEN_BITLY', 'test')
+    monkeypatch.setattr(bitly, 'BITLY_TIMEOUT', 0.05)
+    monkeypatch.setattr(bitly, 'BITLY_RETRIES', 1)
+    monkeypatch.setattr(bitly, '_queue', [])
+    monkeypatch.setattr(bitly, '_client', httpx.AsyncClient(
+        base_url='https://bitly.test/v4/', transport=httpx.MockTransport(handler)
+    ))
+    yield requests
+    bitly.close()
+
+
+def _create_links(*paths: str) -> list[int]:
+    '''Create links to https://example.com<path>, which queues them for shortening.'''
+    created = db_tools.create_links([
+        schemas.LinkCreate(
+            target_url=f'https://example.com{path}', source='bitly source', medium='bitly medium',
+            campaign_project='bitly project', term_material='bitly material', term_page='bitly page',
+            user='bitly user', content='bitly content',
+        )
+        for path in paths
+    ])
+    return [link.id for link in created.links]
+
+
+def _short_urls(ids: list[int]) -> list[str | None]:
+    table = models.Link.__table__
+    with db.SessionLocal() as session:
+        short_urls = dict(session.execute(select(table.c.id, table.c.short_url).where(table.c.id.in_(ids))).all())
+    return [short_urls[link_id] for link_id in ids]
+
+
+def test_retry_delay():
+    response = httpx.Response(429, headers={'Retry-After': '3600'})
+    assert bitly._retry_delay(response, 0) == bitly.BITLY_TIMEOUT
+    assert bitly._retry_delay(httpx.Response(429, headers={'Retry-After': '1.5'}), 0) == 1.5
+    assert bitly._retry_delay(httpx.Response(503), 1) == 1.0
+    assert bitly._retry_delay(None, 10) == bitly.BITLY_TIMEOUT
+
+
+def test_flush_writes_short_urls_back(bitly_api):
+    ids = _create_links('/ok', '/also-ok')
+    assert len(bitly._queue) == 2
+    bitly.flush()
+    assert _short_urls(ids) == ['https://bit.ly/ok', 'https://bit.ly/also-ok']
+    assert bitly._queue == []
+
+
+def test_refused_and_malformed_links_are_dropped(bitly_api):
+    ids = _create_links('/refused', '/ok', '/malformed')
+    bitly.flush()
+    assert _short_urls(ids) == [None, 'https://bit.ly/ok', None]
+    assert bitly._queue == []
+    assert sorted(bitly_api) == ['/malformed', '/ok', '/refused']
+
+
+def test_rate_limit_waits_at_most_the_timeout(bitly_api):
+    [link_id] = _create_links('/limited')
+    started = monotonic()
+    bitly.flush()
+    assert monotonic() - started < 1
+    assert _short_urls([link_id]) == ['https://bit.ly/limited']
+    assert bitly_api == ['/limited', '/limited']
+
+
+def test_failing_links_are_dropped_after_max_flushes(bitly_api, monkeypatch):
+    monkeypatch.setattr(bitly, 'BITLY_MAX_FLUSHES', 2)
+    ids = _create_links('/down', '/ok')
+    bitly.flush()
+    assert _short_urls(ids) == [None, 'https://bit.ly/ok']
+    assert [link[2].split('?')[0] for link in bitly._queue] == ['https://example.com/down']
+
+    bitly.flush()
+    assert bitly._queue == []
+    assert bitly_api.count('/down') == 2 * (bitly.BITLY_RETRIES + 1)
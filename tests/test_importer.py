@@ -0,0 +1,101 @@
+import csv
+import io
+from datetime import datetime
+
+from sqlalchemy import select
+
+from link_dealer import db, db_tools, importer, models, schemas
+
+FIELDS = [
+    'target_url', 'campaign_date', 'source', 'medium', 'campaign_project', 'term_material', 'term_page', 'user',
+    'short_code', 'full_url',
+]
+
+
+def _csv(*rows: dict) -> io.StringIO:
+    file = io.StringIO()
+    writer = csv.DictWriter(file, fieldnames=FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({
+            'campaign_date': '2024-05-17', 'source': 'import source', 'medium': 'import medium',
+            'campaign_project': 'import project', 'term_material': 'import material', 'term_page': 'import page',
+            'user': 'import user', **row,
+        })
+    file.seek(0)
+    return file
+
+
+def _import(file: io.StringIO) -> tuple[importer.Importer, list[dict]]:
+    rejects_file = io.StringIO()
+    with db.SessionLocal() as session:
+        link_importer = importer.Importer(session, importer.Rejects(rejects_file, 'csv'))
+        link_importer.run(importer.read_rows(file, 'csv'))
+    rejects_file.seek(0)
+    return link_importer, list(csv.DictReader(rejects_file))
+
+
+def _full_urls(short_codes: list[str]) -> dict[str, str]:
+    with db.SessionLocal() as session:
+        return dict(session.execute(
+            select(models.Link.short_code, models.Link.full_url).where(models.Link.short_code.in_(short_codes))
+        ).all())
+
+
+def test_import_builds_full_urls_like_create_link(databases):
+    link_importer, rejects = _import(_csv(
+        {'target_url': 'https://example.com/a?x=1', 'short_code': 'import-a'},
+        {'target_url': 'https://example.com/b', 'short_code': 'import-b', 'full_url': 'https://example.com/other'},
+    ))
+    assert link_importer.imported == 1
+    assert [(reject['line'], reject['short_code']) for reject in rejects] == [('3', 'import-b')]
+    assert rejects[0]['error'].startswith('full_url does not match')
+
+    names = {
+        'term_material': 'import material', 'term_page': 'import page', 'medium': 'import medium',
+        'source': 'import source', 'campaign_project': 'import project', 'content': '0',
+    }
+    _, full_url = db_tools.make_full_url('https://example.com/a?x=1', datetime(2024, 5, 17), names, '0', '0')
+    assert _full_urls(['import-a']) == {'import-a': full_url}
+
+    link = db_tools.create_link(schemas.LinkCreate(target_url='https://example.com/a?x=1', **names, user='import user'))
+    assert link.full_url.replace(f'{link.campaign_date:%Y%m%d}', '20240517') == full_url
+
+
+def test_import_rejects_unusable_short_codes(databases):
+    month_code = models.new_short_code(datetime(2024, 6, 1))
+    _, rejects = _import(_csv(
+        {'target_url': 'https://example.com', 'short_code': 'a/b'},
+        {'target_url': 'https://example.com', 'short_code': '.hidden'},
+        {'target_url': 'https://example.com', 'short_code': month_code},
+        {'target_url': 'https://example.com', 'short_code': 'twice'},
+        {'target_url': 'https://example.com', 'short_code': 'twice'},
+    ))
+    assert [reject['line'] for reject in rejects] == ['2', '3', '4', '6']
+    assert 'of 2024-06' in rejects[2]['error']
+    assert rejects[3]['error'] == "Short code 'twice' is already used"
+
+
+def test_short_code_taken_during_import_rejects_only_its_row(databases, monkeypatch):
+    _import(_csv({'target_url': 'https://example.com', 'short_code': 'import-race'}))
+
+    # Another writer takes the code between the check and COPY.
+    checks = []
+
+    def taken_short_codes(self, short_codes):
+        checks.append(short_codes)
+        return set() if len(checks) == 1 else taken(self, short_codes)
+
+    taken = importer.Importer._taken_short_codes
+    monkeypatch.setattr(importer.Importer, '_taken_short_codes', taken_short_codes)
+    link_importer, rejects = _import(_csv(
+        {'target_url': 'https://example.com/race', 'short_code': 'import-race'},
+        {'target_url': 'https://example.com/race', 'short_code': 'import-kept'},
+        {'target_url': 'https://example.com/race'},
+    ))
+    assert link_importer.imported == 2
+    assert len(checks) == 2
+    assert [(reject['line'], reject['error']) for reject in rejects] == [
+        ('2', "Short code 'import-race' is already used"),
+    ]
+    assert _full_urls(['import-race', 'import-kept'])['import-kept'].startswith('https://example.com/race?')
@@ -0,0 +1,44 @@
+from base64 import urlsafe_b64encode
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from link_dealer import db_tools
+from link_dealer.api.local_routes import api
+from link_dealer.api.routes import routes
+
+
+def test_cursor_round_trip():
+    campaign_date = datetime(2024, 5, 17, 8, 30, 1, 123456)
+    cursor = db_tools._encode_cursor(campaign_date, 42)
+    assert cursor.isascii() and '/' not in cursor and '+' not in cursor
+    assert db_tools._decode_cursor(cursor) == (campaign_date, 42)
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    urlsafe_b64encode(b'\xff\xfe').decode(),
+    urlsafe_b64encode(b'2024-05-17T08:30:00').decode(),
+    urlsafe_b64encode(b'2024-05-17T08:30:00|42|1').decode(),
+    urlsafe_b64encode(b'yesterday|42').decode(),
+    urlsafe_b64encode(b'2024-05-17T08:30:00|forty-two').decode(),
+])
+def test_decode_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        db_tools._decode_cursor(cursor)
+
+
+def test_escape_like():
+    assert db_tools._escape_like('https://a.com/50%_off\\') == 'https://a.com/50\\%\\_off\\\\'
+
+
+@pytest.mark.parametrize('path', ['/api/last_links', '/api/links'])
+def test_invalid_cursor_is_422(path):
+    app = FastAPI()
+    app.include_router(routes)
+    with TestClient(app) as client:
+        response = client.get(path, params={'cursor': 'bm9wZQ=='}, auth=(api.username, api.password))
+    assert response.status_code == 422
+    assert response.json() == {'detail': 'Invalid cursor'}
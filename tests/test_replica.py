@@ -0,0 +1,219 @@
+import asyncio
+from contextlib import asynccontextmanager
+from time import sleep
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from link_dealer import db, db_tools, models, schemas
+
+UNREACHABLE_URL = 'postgresql+psycopg2://nobody@127.0.0.1:1/nothing'
+INFO = schemas.Info(
+    users=[schemas.User(value='user')],
+    term_materials=[schemas.BaseOption(value='material')],
+    term_pages=[schemas.BaseOption(value='page')],
+    mediums=[schemas.Medium(value='medium', sources=[schemas.BaseOption(value='source')])],
+    campaign_projects=[schemas.BaseOption(value='project')],
+    contents=[schemas.BaseOption(value='content')],
+)
+LINK = schemas.LinkCreate(
+    target_url='https://example.com', source='source', medium='medium', campaign_project='project',
+    term_material='material', term_page='page', user='user', content='content',
+)
+
+
+@pytest.fixture(autouse=True)
+def replica(databases):
+    '''Start every test with a reachable replica.'''
+    if db.ReplicaSessionLocal is None:
+        pytest.skip('The replica is not configured')
+    db._replica_down_until = 0.0
+    yield
+    db._replica_down_until = 0.0
+
+
+@pytest.fixture(scope='module')
+def taxonomy(databases):
+    '''The same options under the same ids on both databases, so link rows can be copied between them.'''
+    tables = ', '.join(f'"{model.__tablename__}"' for model in db_tools.LINK_DIMENSIONS.values())
+    for session_factory in (db.SessionLocal, db.ReplicaSessionLocal):
+        with session_factory() as session:
+            session.execute(text(f'TRUNCATE {tables} RESTART IDENTITY CASCADE'))
+            db_tools._update_info(session, INFO)
+
+
+def _run(coroutine):
+    '''Run a coroutine on a fresh loop and drop the async connections made on it.'''
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await db.async_engine.dispose()
+            await db.async_replica_engine.dispose()
+    return asyncio.run(run())
+
+
+def _database(session) -> str:
+    return session.scalar(text('SELECT current_database()'))
+
+
+def _primary_database() -> str:
+    with db.SessionLocal() as session:
+        return _database(session)
+
+
+def _replica_database() -> str:
+    with db.ReplicaSessionLocal() as session:
+        return _database(session)
+
+
+@pytest.fixture
+def client() -> TestClient:
+    @asynccontextmanager
+    async def lifespan(_: FastAPI):
+        yield
+        # Async connections belong to the loop of the client.
+        await db.async_engine.dispose()
+        await db.async_replica_engine.dispose()
+
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(db.ReadYourWritesMiddleware)
+
+    @app.get('/read')
+    def read():
+        with db.read_session() as session:
+            return {'database': _database(session), 'replica': session.info.get('replica', False)}
+
+    @app.get('/read_async')
+    async def read_async():
+        async with db.async_read_session() as session:
+            database = await session.scalar(text('SELECT current_database()'))
+            return {'database': database, 'replica': session.info.get('replica', False)}
+
+    @app.post('/write')
+    def write(fail: bool = False):
+        if fail:
+            raise HTTPException(status_code=400)
+        with db.read_session() as session:
+            return {'database': _database(session), 'replica': session.info.get('replica', False)}
+
+    with TestClient(app) as client:
+        yield client
+
+
+def test_reads_go_to_replica(client):
+    assert client.get('/read').json() == {'database': _replica_database(), 'replica': True}
+    assert client.get('/read_async').json() == {'database': _replica_database(), 'replica': True}
+
+
+def test_write_reads_primary_and_sets_cookie(client):
+    response = client.post('/write')
+    assert response.json() == {'database': _primary_database(), 'replica': False}
+    cookie = response.headers['set-cookie']
+    assert cookie.startswith(f'{db.STICKY_COOKIE}=1;')
+    assert f'Max-Age={db.REPLICA_STICKY_SECONDS}' in cookie
+
+
+def test_cookie_keeps_reads_on_primary(client):
+    client.post('/write')
+    assert client.get('/read').json() == {'database': _primary_database(), 'replica': False}
+    assert client.get('/read_async').json() == {'database': _primary_database(), 'replica': False}
+
+    client.cookies.clear()
+    assert client.get('/read').json()['replica'] is True
+
+
+def test_failed_write_sets_no_cookie(client):
+    response = client.post('/write', params={'fail': True})
+    assert response.status_code == 400
+    assert 'set-cookie' not in response.headers
+    assert client.get('/read').json()['replica'] is True
+
+
+def test_reads_outside_requests_follow_primary_reads():
+    with db.read_session() as session:
+        assert session.info.get('replica') is True
+    with db.primary_reads():
+        with db.read_session() as session:
+            assert _database(session) == _primary_database()
+            assert not session.info.get('replica')
+
+
+def test_unreachable_replica_falls_back_to_primary(monkeypatch):
+    monkeypatch.setattr(db, 'REPLICA_RETRY_SECONDS', 0.5)
+    attempts = []
+    unreachable = sessionmaker(
+        bind=create_engine(UNREACHABLE_URL, connect_args={'connect_timeout': 1}), info={'replica': True}
+    )
+
+    def replica_session():
+        attempts.append(1)
+        return unreachable()
+
+    monkeypatch.setattr(db, 'ReplicaSessionLocal', replica_session)
+    with db.read_session() as session:
+        assert _database(session) == _primary_database()
+        assert not session.info.get('replica')
+    assert len(attempts) == 1
+
+    # The replica is skipped until REPLICA_RETRY_SECONDS have passed.
+    with db.read_session() as session:
+        assert _database(session) == _primary_database()
+    assert len(attempts) == 1
+
+    sleep(0.6)
+    with db.read_session() as session:
+        assert _database(session) == _primary_database()
+    assert len(attempts) == 2
+
+
+def test_unreachable_replica_falls_back_to_primary_async(monkeypatch):
+    monkeypatch.setattr(db, 'REPLICA_RETRY_SECONDS', 60)
+    unreachable = create_async_engine(UNREACHABLE_URL.replace('psycopg2', 'asyncpg'), connect_args={'timeout': 1})
+    monkeypatch.setattr(db, 'AsyncReplicaSessionLocal', async_sessionmaker(bind=unreachable, info={'replica': True}))
+
+    async def read():
+        async with db.async_read_session() as session:
+            return await session.scalar(text('SELECT current_database()')), session.info.get('replica', False)
+
+    assert _run(read()) == (_primary_database(), False)
+    assert db._replica_down_until > 0
+    # Sync reads skip the replica as well.
+    with db.read_session() as session:
+        assert not session.info.get('replica')
+
+
+def _create_link(full_url_on_replica: str | None) -> str:
+    '''Create a link on the primary and, unless None, copy it to the replica with another full url.'''
+    link = db_tools.create_link(LINK)
+    if full_url_on_replica is not None:
+        table = models.Link.__table__
+        with db.SessionLocal() as session:
+            row = dict(session.execute(select(table).where(table.c.id == link.id)).mappings().one())
+        with db.ReplicaSessionLocal() as session:
+            session.execute(insert(table).values({**row, 'full_url': full_url_on_replica}))
+            session.commit()
+    return link.short_code
+
+
+def test_redirect_reads_replica(taxonomy):
+    short_code = _create_link('https://replica.example.com')
+    assert db_tools.get_full_url(short_code) == 'https://replica.example.com'
+
+    short_code = _create_link('https://replica.example.com/async')
+    assert _run(db_tools.get_full_url_async(short_code)) == 'https://replica.example.com/async'
+
+
+def test_redirect_retries_on_primary(taxonomy):
+    short_code = _create_link(None)
+    assert db_tools.get_full_url(short_code).startswith('https://example.com?')
+
+    short_code = _create_link(None)
+    assert _run(db_tools.get_full_url_async(short_code)).startswith('https://example.com?')
+
+    assert db_tools.get_full_url('unknown') is None
+    assert _run(db_tools.get_full_url_async('unknown')) is None
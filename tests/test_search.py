@@ -0,0 +1,80 @@
+import sys
+
+import pytest
+
+from link_dealer import schemas, search
+
+
+def _options(*names: str) -> tuple[schemas.BaseOption, ...]:
+    '''Options in rank order, heaviest first, with idents 1, 2, ...'''
+    return tuple(schemas.BaseOption(ident=ident, value=name) for ident, name in enumerate(names, 1))
+
+
+def _values(options: list[schemas.BaseOption]) -> list[str]:
+    return [option.value for option in options]
+
+
+def test_prefix_end():
+    assert search._prefix_end('ab') == 'ac'
+    assert search._prefix_end('a' + chr(sys.maxunicode)) == 'b'
+    assert search._prefix_end(chr(sys.maxunicode) * 2) is None
+    assert search._prefix_end('') is None
+
+
+@pytest.mark.parametrize('prefix_sort_max', [search.PREFIX_SORT_MAX, 0])
+def test_prefix_matches_come_first_in_rank_order(monkeypatch, prefix_sort_max):
+    monkeypatch.setattr(search, 'PREFIX_SORT_MAX', prefix_sort_max)
+    index = search.OptionIndex(_options('Newsletter', 'news', 'Good news', 'newsroom', 'other', 'new'))
+    assert _values(index.search('NEWS', 10)) == ['Newsletter', 'news', 'newsroom', 'Good news']
+    assert _values(index.search('new', 2)) == ['Newsletter', 'news']
+    assert _values(index.search('ews', 10)) == ['Newsletter', 'news', 'Good news', 'newsroom']
+    assert index.search('absent', 10) == []
+
+
+def test_empty_query_lists_options_in_rank_order():
+    index = search.OptionIndex(_options('b', 'a', 'c'))
+    assert _values(index.search('', 2)) == ['b', 'a']
+    assert _values(index.search('', 10, allowed={2, 0})) == ['b', 'c']
+
+
+def test_query_ending_in_the_last_code_point():
+    index = search.OptionIndex(_options('a' + chr(sys.maxunicode), 'b'))
+    assert _values(index.search('a' + chr(sys.maxunicode), 10)) == ['a' + chr(sys.maxunicode)]
+    assert _values(index.search(chr(sys.maxunicode), 10)) == ['a' + chr(sys.maxunicode)]
+
+
+def test_allowed_ranks_filter_prefix_and_substring_matches():
+    index = search.OptionIndex(_options('shop', 'shop two', 'my shop', 'your shop'))
+    assert _values(index.search('shop', 10, allowed={1, 3})) == ['shop two', 'your shop']
+    assert index.search('shop', 10, allowed=set()) == []
+
+
+def test_sources_follow_weight_order_not_medium_order():
+    light, heavy, other = _options('shop_light', 'shop_heavy', 'shop_other')
+    info = schemas.Info(mediums=[
+        schemas.Medium(ident=1, value='first', sources=[light, other]),
+        schemas.Medium(ident=2, value='second', sources=[heavy, light]),
+    ])
+    info._source_order = (heavy.ident, other.ident, light.ident)
+    index = search.TaxonomyIndex(1, info)
+    assert _values(index.search('sources', 'shop', 10)) == ['shop_heavy', 'shop_other', 'shop_light']
+    assert _values(index.search('sources', 'shop', 10, medium=1)) == ['shop_other', 'shop_light']
+    assert _values(index.search('sources', 'shop', 1, medium=2)) == ['shop_heavy']
+    assert index.search('sources', 'shop', 10, medium=3) == []
+    assert _values(index.search('mediums', '', 10)) == ['first', 'second']
+
+
+def test_index_is_reused_for_unchanged_kinds(monkeypatch):
+    monkeypatch.setattr(search, '_index', None)
+    info = schemas.Info(users=[schemas.User(ident=1, value='ann')], contents=list(_options('a', 'b')))
+    first = search.get_index(1, info)
+    assert search.get_index(1, info) is first
+    assert search.cached_index(1) is first
+    assert search.cached_index(2) is None
+
+    changed = schemas.Info(users=[schemas.User(ident=1, value='anna')], contents=list(_options('a', 'b')))
+    second = search.get_index(2, changed)
+    assert second is not first
+    assert second.indexes['contents'] is first.indexes['contents']
+    assert second.indexes['users'] is not first.indexes['users']
+    assert _values(second.search('users', 'ann', 10)) == ['anna']
@@ -0,0 +1,102 @@
+import gzip
+
+import brotli
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from link_dealer import schemas
+from link_dealer.api import service
+
+INFO = schemas.Info(term_pages=[schemas.BaseOption(ident=1, value='page')])
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('', 'identity'),
+    ('gzip', 'gzip'),
+    ('gzip, deflate, br', 'br'),
+    ('BR;q=0.5, gzip', 'br'),
+    ('br;q=0, gzip', 'gzip'),
+    ('br; q=0.000, gzip;q=0.0', 'identity'),
+    ('deflate, *', 'identity'),
+])
+def test_accepted_encoding(accept_encoding, expected):
+    assert service._accepted_encoding(accept_encoding) == expected
+
+
+@pytest.mark.parametrize('if_none_match, expected', [
+    ('', False),
+    ('"1.abc"', True),
+    ('"1.abc-br"', True),
+    ('W/"1.abc-gzip"', True),
+    ('"0.def", "1.abc"', True),
+    ('*', True),
+    ('"1.abd"', False),
+    ('"2.abc"', False),
+])
+def test_etag_matches(if_none_match, expected):
+    assert service._etag_matches(if_none_match, '"1.abc"') is expected
+
+
+@pytest.fixture
+def client(monkeypatch) -> TestClient:
+    monkeypatch.setattr(service, '_encoded_responses', {})
+    app = FastAPI()
+    versions = {'version': 1}
+
+    @app.get('/info')
+    async def info(request: Request):
+        return await service.cached_json_response(request, 'info', versions['version'], INFO)
+
+    with TestClient(app) as client:
+        client.versions = versions
+        yield client
+
+
+def test_cached_json_response_encodings(client):
+    body = INFO.model_dump_json().encode()
+
+    response = client.get('/info', headers={'Accept-Encoding': 'identity'})
+    assert response.content == body
+    assert 'content-encoding' not in response.headers
+    etag = response.headers['etag']
+    assert etag.startswith('"1.')
+
+    response = client.get('/info', headers={'Accept-Encoding': 'br'})
+    assert response.headers['content-encoding'] == 'br'
+    assert response.headers['etag'] == f'{etag[:-1]}-br"'
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert response.content == body
+
+    response = client.get('/info', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['etag'] == f'{etag[:-1]}-gzip"'
+    assert response.content == body
+
+    _, _, bodies = service._encoded_responses['info']
+    assert brotli.decompress(bodies['br']) == gzip.decompress(bodies['gzip']) == body
+
+
+def test_cached_json_response_not_modified(client):
+    etag = client.get('/info', headers={'Accept-Encoding': 'gzip'}).headers['etag']
+
+    response = client.get('/info', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['etag'] == etag
+
+    # Any content coding of the same body matches.
+    response = client.get('/info', headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+    assert response.status_code == 304
+
+    client.versions['version'] = 2
+    response = client.get('/info', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['etag'].startswith('"2.')
+
+
+def test_warm_json_response(monkeypatch):
+    monkeypatch.setattr(service, '_encoded_responses', {})
+    service.warm_json_response('info', 1, INFO)
+    version, _, bodies = service._encoded_responses['info']
+    assert version == 1
+    assert set(bodies) == {'identity', 'br', 'gzip'}
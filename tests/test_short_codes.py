@@ -0,0 +1,64 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from link_dealer import db_tools, models
+
+
+@pytest.mark.parametrize('campaign_date', [
+    datetime(2000, 1, 1), datetime(2024, 5, 31, 23, 59), datetime(2099, 12, 15), datetime(2319, 12, 1),
+])
+def test_short_code_month_round_trip(campaign_date):
+    short_code = models.new_short_code(campaign_date)
+    assert len(short_code) == models.SHORT_CODE_LENGTH
+    assert set(short_code) <= set(models.SHORT_CODE_ALPHABET)
+    assert models.short_code_month(short_code) == date(campaign_date.year, campaign_date.month, 1)
+
+
+def test_short_codes_of_a_month_share_the_prefix():
+    codes = {models.new_short_code(datetime(2024, 5, day)) for day in range(1, 29)}
+    assert len(codes) == 28
+    assert {code[:2] for code in codes} == {models.new_short_code(datetime(2024, 5, 1))[:2]}
+    assert models.new_short_code(datetime(2024, 6, 1))[:2] != models.new_short_code(datetime(2024, 5, 1))[:2]
+
+
+@pytest.mark.parametrize('short_code', ['abcdefgh', '_1f3a', 'abcdefghij', '-bcdefghi', ''])
+def test_short_code_month_of_other_codes(short_code):
+    assert models.short_code_month(short_code) is None
+
+
+class _Session:
+    rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def _colliding(collisions: int):
+    '''A create callable whose first `collisions` calls hit a taken short code.'''
+    calls = []
+
+    def create(session, value):
+        calls.append(value)
+        if len(calls) <= collisions:
+            raise IntegrityError('INSERT INTO link', {}, Exception('duplicate key value'))
+        return value
+
+    return create, calls
+
+
+def test_retry_short_codes_redoes_the_transaction():
+    session = _Session()
+    create, calls = _colliding(db_tools.SHORT_CODE_ATTEMPTS - 1)
+    assert db_tools._retry_short_codes(session, create, 'link') == 'link'
+    assert len(calls) == db_tools.SHORT_CODE_ATTEMPTS
+    assert session.rollbacks == db_tools.SHORT_CODE_ATTEMPTS - 1
+
+
+def test_retry_short_codes_gives_up():
+    session = _Session()
+    create, calls = _colliding(db_tools.SHORT_CODE_ATTEMPTS)
+    with pytest.raises(IntegrityError):
+        db_tools._retry_short_codes(session, create, 'link')
+    assert len(calls) == session.rollbacks == db_tools.SHORT_CODE_ATTEMPTS
@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, func, select
+
+from link_dealer import db, db_tools, models, schemas
+from link_dealer.api.local_routes import api
+from link_dealer.api.routes import routes
+
+
+def _run(coroutine):
+    '''Run a coroutine on a fresh loop and drop the async connections made on it.'''
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await db.async_engine.dispose()
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def bulk(databases):
+    '''Remove the options of a bulk test afterwards.'''
+    yield
+    with db.SessionLocal() as session:
+        medium_ids = select(models.Medium.id).where(models.Medium.name.startswith('bulk'))
+        session.execute(delete(models.medium_source).where(models.medium_source.c.medium_id.in_(medium_ids)))
+        for model in (models.Medium, models.Source, models.User):
+            session.execute(delete(model).where(model.name.startswith('bulk')))
+        db_tools._bump_taxonomy_version(session)
+        session.commit()
+
+
+def test_update_info_async_splits_large_taxonomies(bulk):
+    '''Inserts and renames of more users than asyncpg takes bind parameters for in one statement.'''
+    size = 32767 // 2 + 100
+    info = _run(db_tools.update_info_async(schemas.Info(
+        users=[schemas.User(value=f'bulk user {i}', is_bot=i % 2 == 0) for i in range(size)],
+    )))
+    users = [user for user in info.users if user.value.startswith('bulk user')]
+    assert len(users) == size
+    assert sum(user.is_bot for user in users) == (size + 1) // 2
+
+    info = _run(db_tools.update_info_async(schemas.Info(
+        users=[schemas.User(ident=user.ident, value=f'{user.value} renamed') for user in users],
+    )))
+    assert sum(user.value.endswith(' renamed') for user in info.users) == size
+
+
+def test_update_info_splits_sources_and_pairs(bulk, monkeypatch):
+    monkeypatch.setattr(db_tools, 'MAX_BIND_PARAMS', 10)
+    sources = [schemas.BaseOption(value=f'bulk source {i}') for i in range(12)]
+    info = _run(db_tools.update_info_async(schemas.Info(
+        mediums=[schemas.Medium(value='bulk medium', sources=sources)],
+    )))
+    [medium] = [medium for medium in info.mediums if medium.value == 'bulk medium']
+    assert sorted(source.value for source in medium.sources) == sorted(source.value for source in sources)
+
+    # Known sources by ident, more than fit in one statement.
+    info = db_tools.update_info(schemas.Info(
+        mediums=[schemas.Medium(value='bulk medium 2', sources=medium.sources)],
+    ))
+    [medium_2] = [medium for medium in info.mediums if medium.value == 'bulk medium 2']
+    assert sorted(source.ident for source in medium_2.sources) == sorted(source.ident for source in medium.sources)
+    with db.SessionLocal() as session:
+        assert session.scalar(
+            select(func.count()).select_from(models.medium_source)
+            .join(models.Medium, models.Medium.id == models.medium_source.c.medium_id)
+            .where(models.Medium.name.startswith('bulk medium'))
+        ) == 24
+
+
+@pytest.fixture
+def renamable(databases) -> dict[str, int]:
+    '''Ids of term pages 'rename a', 'rename b' and 'rename c', with a link to 'rename a'.'''
+    info = db_tools.update_info(schemas.Info(
+        users=[schemas.User(value='rename user')],
+        term_materials=[schemas.BaseOption(value='rename material')],
+        term_pages=[schemas.BaseOption(value=name) for name in ('rename a', 'rename b', 'rename c')],
+        mediums=[schemas.Medium(value='rename medium', sources=[schemas.BaseOption(value='rename source')])],
+        campaign_projects=[schemas.BaseOption(value='rename project')],
+        contents=[schemas.BaseOption(value='rename content')],
+    ))
+    db_tools.create_link(schemas.LinkCreate(
+        target_url='https://example.com/rename', source='rename source', medium='rename medium',
+        campaign_project='rename project', term_material='rename material', term_page='rename a',
+        user='rename user', content='rename content',
+    ))
+    yield {page.value: page.ident for page in info.term_pages if page.value.startswith('rename')}
+    with db.SessionLocal() as session:
+        session.execute(delete(models.Link).where(models.Link.target_url == 'https://example.com/rename'))
+        session.commit()
+
+
+def _post_update_info(data: schemas.Info):
+    app = FastAPI()
+    app.include_router(routes)
+    with TestClient(app) as client:
+        return client.post('/api/update_info', content=data.model_dump_json(), auth=(api.username, api.password))
+
+
+def _term_page_names(ids: dict[str, int]) -> dict[int, str]:
+    with db.SessionLocal() as session:
+        return dict(session.execute(
+            select(models.TermPage.id, models.TermPage.name).where(models.TermPage.id.in_(ids.values()))
+        ).tuples().all())
+
+
+def test_rename_onto_a_taken_name_is_422_and_rolled_back(renamable):
+    names = _term_page_names(renamable)
+    response = _post_update_info(schemas.Info(
+        term_materials=[schemas.BaseOption(value='rename material added')],
+        term_pages=[
+            schemas.BaseOption(ident=renamable['rename c'], value='rename c2'),
+            schemas.BaseOption(ident=renamable['rename a'], value='rename b'),
+        ],
+    ))
+    assert response.status_code == 422
+    assert response.json() == {
+        'detail': f"term_page 'rename b' is already the name of term_page {renamable['rename b']}",
+    }
+    assert _term_page_names(renamable) == names
+    with db.SessionLocal() as session:
+        assert session.scalar(
+            select(func.count()).select_from(models.TermMaterial)
+            .where(models.TermMaterial.name == 'rename material added')
+        ) == 0
+
+
+def test_rename_updates_names_on_links(renamable):
+    response = _post_update_info(schemas.Info(
+        term_pages=[schemas.BaseOption(ident=renamable['rename a'], value='rename a2')],
+    ))
+    assert response.status_code == 200
+    assert 'rename a2' in [page.value for page in schemas.Info.model_validate(response.json()).term_pages]
+    with db.SessionLocal() as session:
+        assert session.execute(
+            select(models.Link.term_page_id, models.Link.term_page_name)
+            .where(models.Link.target_url == 'https://example.com/rename')
+        ).tuples().all() == [(renamable['rename a'], 'rename a2')]
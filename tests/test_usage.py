@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from link_dealer import db, db_tools, models, schemas, usage
+
+PAGES = ['usage page 0', 'usage page 1', 'usage page 2', 'usage page 3', 'usage page 4']
+
+
+@pytest.fixture
+def pages(databases) -> dict[str, int]:
+    '''Term pages with weights 0, 1, 2, 5 and 15 and a decay that is due.'''
+    db_tools.update_info(schemas.Info(term_pages=[schemas.BaseOption(value=name) for name in PAGES]))
+    with db.SessionLocal() as session:
+        ids = dict(session.execute(
+            select(models.TermPage.name, models.TermPage.id).where(models.TermPage.name.in_(PAGES))
+        ).all())
+        for name, weight in zip(PAGES, (0, 1, 2, 5, 15)):
+            session.execute(update(models.TermPage).where(models.TermPage.id == ids[name]).values(weight=weight))
+        session.execute(update(models.TaxonomyVersion).values(decayed_at=datetime.now() - timedelta(days=2)))
+        session.commit()
+    return ids
+
+
+def _weights(ids: dict[str, int]) -> list[int]:
+    with db.SessionLocal() as session:
+        weights = dict(session.execute(
+            select(models.TermPage.id, models.TermPage.weight).where(models.TermPage.id.in_(ids.values()))
+        ).all())
+    return [weights[ids[name]] for name in PAGES]
+
+
+@pytest.mark.parametrize('decay, expected', [
+    (0.9, [0, 1, 2, 5, 14]),
+    (0.5, [0, 1, 1, 3, 8]),
+    (0.2, [0, 0, 0, 1, 3]),
+])
+def test_decay_rounds_weights(pages, monkeypatch, decay, expected):
+    monkeypatch.setattr(usage, 'USAGE_DECAY', decay)
+    with db.SessionLocal() as session:
+        assert usage._decay(session)
+        session.commit()
+    assert _weights(pages) == expected
+
+
+def test_decay_runs_once_per_interval(pages, monkeypatch):
+    monkeypatch.setattr(usage, 'USAGE_DECAY', 0.5)
+    with db.SessionLocal() as session:
+        assert usage._decay(session)
+        assert not usage._decay(session)
+        session.commit()
+    assert _weights(pages) == [0, 1, 1, 3, 8]